@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""Time spent flattening and rendering the report for many components and distributions
+
+Run from the repository root, e.g. `python3 benchmarks/bench_flatten.py --components 600 --distros 30`.
+"""
+
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_gitlab import SyntheticGroup
+from qubes_g2g_report.metrics import Metrics
+from qubes_g2g_report.report_builder import ReportBuilder
+
+
+def run(components: int, distros: int, releases: list, repeat: int) -> dict:
+    # Enough jobs per pipeline for each stage of each distribution of each release
+    dataset = SyntheticGroup(components, len(releases) * len(SyntheticGroup.STAGES) * distros, releases=releases,
+                             distros=distros, overrides_every=0, retried_every=0)
+    with tempfile.TemporaryDirectory() as output_dir:
+        metrics = Metrics()
+        builder = ReportBuilder("https://gitlab.com", releases, output_dir=Path(output_dir), metrics=metrics)
+        distros_jobs = dataset.make_distros(builder)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            builder.write_report(distros_jobs)
+        total_time = time.perf_counter() - start
+        builder.close()
+
+    return {
+        'components': components,
+        'distros': len(dataset.distros),
+        'cells': sum(len(release_components) for release_distros in distros_jobs.values()
+                     for release_components in release_distros.values()),
+        'flatten_seconds': round(metrics.phases['flatten'] / repeat, 3),
+        # Pages are rendered while they are written
+        'render_seconds': round(metrics.phases['render'] / repeat, 3),
+        'total_seconds': round(total_time / repeat, 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--components", type=int, default=600)
+    parser.add_argument("--distros", type=int, default=30)
+    parser.add_argument("--release", action="append", help="Release columns (repeatable, default: 4.2 and 4.3)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed report generations")
+    args = parser.parse_args()
+    print(json.dumps(run(args.components, args.distros, args.release or ['4.2', '4.3'], args.repeat), indent=2))
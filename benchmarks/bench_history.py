@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""Write and query times of the SQLite history store over many synthetic runs
+
+Run from the repository root, e.g. `python3 benchmarks/bench_history.py --projects 500 --runs 200`.
+"""
+
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_gitlab import SyntheticGroup
+from qubes_g2g_report.history_store import HistoryStore
+from qubes_g2g_report.report_builder import ReportBuilder
+
+
+def run(projects: int, jobs: int, runs: int, queries: int) -> dict:
+    releases = ['4.2', '4.3']
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = Path(work_dir) / 'history.db'
+        store = HistoryStore(path)
+        dataset = SyntheticGroup(projects, jobs, releases=releases, overrides_every=0, retried_every=0)
+        builder = ReportBuilder("https://gitlab.com", releases)
+
+        record_time = 0.0
+        jobs_count = 0
+        for run_index in range(runs):
+            # Each run has new pipelines for a tenth of the projects
+            dataset.bump(range(run_index % 10, projects, 10))
+            distros = dataset.make_distros(builder)
+            jobs_count += sum(len(cell['jobs']) for release_distros in distros.values()
+                              for components in release_distros.values() for cell in components.values())
+            start = time.perf_counter()
+            run_id = store.record_run(distros, releases)
+            record_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        store.load_distros(run_id)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in range(queries):
+            store.get_last_known_good(f"qubes-component{query % projects:05d}", releases[0],
+                                      dataset.distros[query % len(dataset.distros)])
+        last_known_good_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in range(queries):
+            store.get_status_transitions(f"qubes-component{query % projects:05d}", releases[0],
+                                         dataset.distros[query % len(dataset.distros)])
+        transitions_time = time.perf_counter() - start
+
+        store.close()
+        builder.close()
+        size = path.stat().st_size
+
+    return {
+        'projects': projects,
+        'runs': runs,
+        'jobs_per_run': jobs_count // runs,
+        'record_run_ms': round(record_time / runs * 1000, 2),
+        'load_run_ms': round(load_time * 1000, 2),
+        'last_known_good_query_ms': round(last_known_good_time / queries * 1000, 3),
+        'status_transitions_query_ms': round(transitions_time / queries * 1000, 3),
+        'database_mib': round(size / 1024 / 1024, 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--jobs", type=int, default=80, help="Jobs per pipeline")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=1000, help="Queries of each kind")
+    args = parser.parse_args()
+    print(json.dumps(run(args.projects, args.jobs, args.runs, args.queries), indent=2))
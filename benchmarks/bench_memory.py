@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Memory used by the crawl of a large synthetic group, served by a local GitLab stand-in
+
+Each scenario runs in a fresh process. Besides peak RSS, the memory held by the
+crawled model once the crawl is over is reported, so that what is left, the
+memory used while decoding responses, can be compared across group and page
+sizes, e.g.:
+
+    python3 benchmarks/bench_memory.py --scale 500x100 --scale 2000x100 --page-size 10 --page-size 40
+"""
+
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+
+from pathlib import Path
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_DIR))
+
+from benchmarks.fake_gitlab import FakeGitlabServer, SyntheticGroup
+
+
+def _rss_mib() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def run_worker(args) -> dict:
+    from qubes_g2g_report import graphql_decoder
+    from qubes_g2g_report.report_builder import ReportBuilder
+
+    if args.no_streaming:
+        graphql_decoder.ijson = None
+
+    builder = ReportBuilder(args.gitlab, args.release, builder_config_url=args.builder_config_url,
+                            page_size=args.page_size, project_batch_size=args.page_size)
+    gc.collect()
+    baseline_rss = _rss_mib()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        components, builder_components_configs = builder.fetch_components()
+        distros = builder.resolve_distros(components, builder_components_configs)
+    crawl_time = time.perf_counter() - start
+    gc.collect()
+    model_rss = _rss_mib()
+    builder.close()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'crawl_seconds': round(crawl_time, 3),
+        'components': len(components),
+        'cells': sum(len(components) for release_distros in distros.values() for components in release_distros.values()),
+        'peak_rss_mib': round(peak_rss, 1),
+        'model_mib': round(model_rss - baseline_rss, 1),
+        # Memory only used during the crawl, e.g. decoded responses
+        'crawl_overhead_mib': round(peak_rss - model_rss, 1),
+    }
+
+
+def run_scenario(server: FakeGitlabServer, releases: list, page_size: int, streaming: bool) -> dict:
+    command = [
+        sys.executable, __file__, '--worker',
+        '--gitlab', server.url,
+        '--builder-config-url', server.builder_config_url,
+        '--page-size', str(page_size),
+    ]
+    for release in releases:
+        command += ['--release', release]
+    if not streaming:
+        command.append('--no-streaming')
+    output = subprocess.run(command, cwd=REPOSITORY_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", action="append",
+                        help="PROJECTSxJOBS, jobs being per pipeline (repeatable, default: 500x100 and 2000x100)")
+    parser.add_argument("--page-size", type=int, action="append",
+                        help="Projects per page and per batched query (repeatable, default: 20)")
+    parser.add_argument("--release", action="append", help="Release numbers (repeatable, default: 4.2 and 4.3)")
+    parser.add_argument("--compare", action="store_true",
+                        help="Also run each scenario without ijson, decoding whole responses")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--gitlab", help=argparse.SUPPRESS)
+    parser.add_argument("--builder-config-url", help=argparse.SUPPRESS)
+    parser.add_argument("--no-streaming", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.release = args.release or ['4.2', '4.3']
+
+    if args.worker:
+        args.page_size = args.page_size[0]
+        print(json.dumps(run_worker(args)))
+        sys.exit(0)
+
+    results = []
+    for scale in args.scale or ['500x100', '2000x100']:
+        projects, jobs = [int(value) for value in scale.split('x')]
+        server = FakeGitlabServer(SyntheticGroup(projects, jobs, releases=args.release),
+                                  complexity_limit=10 ** 9).start()
+        try:
+            for page_size in args.page_size or [20]:
+                for streaming in [True, False] if args.compare else [True]:
+                    result = run_scenario(server, args.release, page_size, streaming)
+                    result.update({'projects': projects, 'jobs_per_pipeline': jobs, 'page_size': page_size,
+                                   'streaming': streaming})
+                    print(f"* {projects} projects x {jobs} jobs, page size {page_size}, streaming {streaming}: "
+                          f"{result['peak_rss_mib']} MiB peak, {result['model_mib']} MiB model, "
+                          f"{result['crawl_overhead_mib']} MiB crawl overhead", file=sys.stderr)
+                    results.append(result)
+        finally:
+            server.shutdown()
+            server.server_close()
+    print(json.dumps(results, indent=2))
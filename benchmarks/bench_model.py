@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Memory and time used by the Component/Job model on a synthetic group
+
+Run from the repository root, e.g. `python3 benchmarks/bench_model.py --projects 2000 --jobs 300`.
+"""
+
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_gitlab import SyntheticGroup
+from qubes_g2g_report.component import Component
+
+
+def run(projects: int, jobs: int, lookups: int) -> dict:
+    releases = ['4.2', '4.3']
+    # Round-trip through JSON so that nodes do not share strings, as with a real response
+    dataset = SyntheticGroup(projects, jobs, releases=releases, overrides_every=0, retried_every=0)
+    pipeline_aliases = dataset.release_pipeline_aliases()
+    raw_pages = [json.dumps(dataset.project_node(index, pipeline_aliases)) for index in range(projects)]
+
+    gc.collect()
+    tracemalloc.start()
+    components = [Component(json.loads(page)) for page in raw_pages]
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del components
+    gc.collect()
+
+    # Timed separately, tracemalloc slows down allocations
+    start = time.perf_counter()
+    components = [Component(json.loads(page)) for page in raw_pages]
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(lookups):
+        for component in components:
+            for release in releases:
+                for job_type_jobs in component.get_release_jobs(release, None).values():
+                    for job in job_type_jobs.values():
+                        job.creation_time, job.status, job.path, job.type, job.release, job.distribution
+    lookup_time = time.perf_counter() - start
+
+    return {
+        'projects': projects,
+        'jobs_per_pipeline': jobs,
+        'build_seconds': round(build_time, 3),
+        'lookup_seconds': round(lookup_time, 3),
+        'retained_mib': round(retained / 1024 / 1024, 1),
+        'peak_mib': round(peak / 1024 / 1024, 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--jobs", type=int, default=100, help="Jobs per pipeline")
+    parser.add_argument("--lookups", type=int, default=1, help="Release job lookups per component")
+    args = parser.parse_args()
+    print(json.dumps(run(args.projects, args.jobs, args.lookups), indent=2))
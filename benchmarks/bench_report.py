@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""End to end benchmark of ReportBuilder.generate_report against a local GitLab stand-in
+
+Each scenario runs the report generation in a fresh process so that peak RSS is
+measured per scenario, e.g.:
+
+    python3 benchmarks/bench_report.py --scale 50x30 --scale 500x100 --latency 0.05 --output results.json
+"""
+
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_DIR))
+
+from benchmarks.fake_gitlab import FakeGitlabServer, SyntheticGroup
+
+
+def run_worker(args) -> dict:
+    from qubes_g2g_report.metrics import Metrics
+    from qubes_g2g_report.report_builder import ReportBuilder
+
+    metrics = Metrics()
+    builder = ReportBuilder(args.gitlab, args.release,
+                            jobs=args.concurrency,
+                            state_file=args.state_file,
+                            incremental=args.incremental,
+                            builder_config_url=args.builder_config_url,
+                            output_dir=args.output_dir,
+                            metrics=metrics)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.generate_report()
+    wall_time = time.perf_counter() - start
+
+    return {
+        'wall_seconds': round(wall_time, 3),
+        # Phases run concurrently (config_fetch) are summed across threads
+        'phases_seconds': {phase: round(duration, 3) for phase, duration in metrics.phases.items()},
+        'client_requests': len(metrics.requests),
+        'client_retries': sum(request['retries'] for request in metrics.requests),
+        'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_scenario(server: FakeGitlabServer, work_dir: Path, releases: list, concurrency: int, incremental: bool) -> dict:
+    command = [
+        sys.executable, __file__, '--worker',
+        '--gitlab', server.url,
+        '--builder-config-url', server.builder_config_url,
+        '--output-dir', str(work_dir / 'public'),
+        '--state-file', str(work_dir / 'state.json'),
+        '--concurrency', str(concurrency),
+    ]
+    for release in releases:
+        command += ['--release', release]
+    if incremental:
+        command.append('--incremental')
+    output = subprocess.run(command, cwd=REPOSITORY_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def run_benchmark(args) -> dict:
+    results = []
+    for scale in args.scale:
+        projects, jobs = [int(value) for value in scale.split('x')]
+        for concurrency in args.concurrency:
+            dataset = SyntheticGroup(projects, jobs, releases=args.release)
+            server = FakeGitlabServer(dataset, latency=args.latency, complexity_limit=args.complexity_limit,
+                                      seconds_per_project=args.seconds_per_project).start()
+            try:
+                with tempfile.TemporaryDirectory() as work_dir:
+                    work_dir = Path(work_dir)
+                    if args.changed is not None:
+                        run_scenario(server, work_dir, args.release, concurrency, False)
+                        dataset.bump(range(min(args.changed, projects)))
+                        server.stats.reset()
+
+                    result = run_scenario(server, work_dir, args.release, concurrency, args.changed is not None)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+            result.update({
+                'projects': projects,
+                'jobs_per_pipeline': jobs,
+                'releases': args.release,
+                'concurrency': concurrency,
+                'latency_seconds': args.latency,
+                'changed_projects': args.changed,
+                **server.stats.as_dict(),
+            })
+            print(f"* {projects} projects x {jobs} jobs, concurrency {concurrency}: "
+                  f"{result['wall_seconds']}s, {result['requests']} requests, "
+                  f"{result['bytes']} bytes, {result['peak_rss_mib']} MiB", file=sys.stderr)
+            results.append(result)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_DIR, check=True,
+                                capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", action="append",
+                        help="PROJECTSxJOBS, jobs being per pipeline (repeatable, default: 50x30)")
+    parser.add_argument("--concurrency", type=int, action="append", help="Value of --jobs (repeatable, default: 4)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every response, in seconds")
+    parser.add_argument("--complexity-limit", type=int, default=250, help="GraphQL complexity limit of the server")
+    parser.add_argument("--seconds-per-project", type=float, default=0.0,
+                        help="Delay added to group crawl responses for each project in the page")
+    parser.add_argument("--changed", type=int,
+                        help="Measure an incremental run after changing pipelines of this many projects")
+    parser.add_argument("--release", action="append", help="Release numbers (repeatable, default: 4.2 and 4.3)")
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--gitlab", help=argparse.SUPPRESS)
+    parser.add_argument("--builder-config-url", help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--state-file", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--incremental", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.concurrency = args.concurrency[0]
+        print(json.dumps(run_worker(args)))
+        sys.exit(0)
+
+    args.release = args.release or ['4.2', '4.3']
+    args.scale = args.scale or ['50x30']
+    args.concurrency = args.concurrency or [4]
+    report = run_benchmark(args)
+    args.output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Results written to {args.output}", file=sys.stderr)
@@ -0,0 +1,523 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Local stand-in for the GitLab GraphQL API and the builder example configurations
+
+The server answers the queries built by ReportBuilder from a synthetic group,
+generated on the fly so that large groups do not need to be kept in memory.
+It understands the subset of GraphQL used by the templates: aliases, arguments
+and nested selections on group/project/pipelines/jobs connections.
+"""
+
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+TOKEN_RE = re.compile(r'\s*(?:(?P<str>"(?:[^"\\]|\\.)*")|(?P<num>-?\d+)|(?P<name>[A-Za-z_][A-Za-z0-9_]*)|(?P<punct>[{}():,\[\]!$=.]))')
+
+
+class GraphQLParser:
+    def __init__(self, text: str):
+        self._tokens = []
+        text = text.strip()
+        pos = 0
+        while pos < len(text):
+            match = TOKEN_RE.match(text, pos)
+            if not match:
+                if text[pos].isspace():
+                    pos += 1
+                    continue
+                raise ValueError(f"Syntax error at offset {pos}: {text[pos:pos + 20]!r}")
+            pos = match.end()
+            self._tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        self._index = 0
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._index][1] if self._index < len(self._tokens) else None
+
+    def _take(self, expected: Optional[str] = None) -> Tuple[str, str]:
+        if self._index >= len(self._tokens):
+            raise ValueError("Unexpected end of query")
+        token = self._tokens[self._index]
+        if expected is not None and token[1] != expected:
+            raise ValueError(f"Expected '{expected}', got '{token[1]}'")
+        self._index += 1
+        return token
+
+    def parse(self) -> list:
+        if self._peek() == 'query':
+            self._take()
+            if self._peek() not in ['{', None]:
+                self._take()
+        return self._selection_set()
+
+    def _selection_set(self) -> list:
+        self._take('{')
+        fields = []
+        while self._peek() != '}':
+            alias = name = self._take()[1]
+            if self._peek() == ':':
+                self._take()
+                name = self._take()[1]
+            arguments = {}
+            if self._peek() == '(':
+                self._take()
+                while self._peek() != ')':
+                    argument = self._take()[1]
+                    self._take(':')
+                    arguments[argument] = self._value()
+                    if self._peek() == ',':
+                        self._take()
+                self._take(')')
+            selection = self._selection_set() if self._peek() == '{' else None
+            fields.append((alias, name, arguments, selection))
+        self._take('}')
+        return fields
+
+    def _value(self):
+        kind, value = self._take()
+        if kind == 'str':
+            return json.loads(value)
+        if kind == 'num':
+            return int(value)
+        if value == '[':
+            items = []
+            while self._peek() != ']':
+                items.append(self._value())
+                if self._peek() == ',':
+                    self._take()
+            self._take(']')
+            return items
+        if value in ['true', 'false']:
+            return value == 'true'
+        if value == 'null':
+            return None
+        return value
+
+
+class SyntheticGroup:
+    """Projects of a GitLab group with the latest pipelines of their branches, shared by all benchmarks"""
+
+    DISTROS = ['host-fc41', 'host-fc42', 'vm-fc41', 'vm-fc42', 'vm-bookworm', 'vm-trixie', 'vm-jammy', 'vm-noble',
+               'vm-archlinux', 'vm-centos-stream9', 'vm-gentoo', 'vm-whonix-gw-17']
+    STAGES = ['build', 'install', 'repro', 'upload', 'publish']
+    STATUSES = ['success', 'failed', 'passed', 'running', 'canceled', 'skipped', 'success', 'success']
+
+    def __init__(self, projects: int = 50, jobs: int = 30, releases: Tuple[str, ...] = ('4.2', '4.3'),
+                 group: str = 'QubesOS', overrides_every: int = 7, retried_every: int = 10,
+                 distros: int = len(DISTROS)):
+        # Distributions past the known ones get generated names
+        self.distros = (self.DISTROS + [f"vm-distro{d:03d}" for d in range(len(self.DISTROS), distros)])[:distros]
+        self.group = group
+        self.jobs = jobs
+        self.overrides_every = overrides_every
+        self.projects = projects
+        self.releases = list(releases)
+        self.retried_every = retried_every
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def project_name(self, index: int) -> str:
+        return f"qubes-component{index:05d}"
+
+    def project_index(self, full_path: str) -> Optional[int]:
+        group, _, name = full_path.lower().partition('/')
+        if group != self.group.lower():
+            return
+        match = re.fullmatch(r'qubes-component(\d+)', name)
+        if match and int(match.group(1)) < self.projects:
+            return int(match.group(1))
+
+    def refs(self, index: int) -> List[str]:
+        refs = [f"release{release}" for release in self.releases] + ['main']
+        if self.overrides_every and index % self.overrides_every == 0:
+            refs.append(f"feature-{index}")
+        return refs
+
+    def bump(self, indexes):
+        """Simulate new pipelines for the given projects"""
+
+        with self._lock:
+            for index in indexes:
+                self._generations[index] = self._generations.get(index, 0) + 1
+
+    def generation(self, index: int) -> int:
+        with self._lock:
+            return self._generations.get(index, 0)
+
+    def pipeline(self, index: int, ref: str) -> Optional[dict]:
+        refs = self.refs(index)
+        if ref not in refs:
+            return
+        ref_index = refs.index(ref)
+        # A few projects have no pipeline for a release branch, to exercise the fallback on main
+        if ref != 'main' and (index * 31 + ref_index) % 11 == 0:
+            return
+        generation = self.generation(index)
+        # Unique, and growing with the generation
+        pipeline_id = 1000000 + (generation * self.projects + index) * 100 + ref_index
+        return {
+            'project_index': index,
+            'generation': generation,
+            'id': f"gid://gitlab/Ci::Pipeline/{pipeline_id}",
+            'iid': str(pipeline_id),
+            'ref': ref,
+            'status': 'SUCCESS',
+            'createdAt': f"2026-10-01T00:00:{generation % 60:02d}Z",
+            'updatedAt': f"2026-10-02T00:00:{generation % 60:02d}Z",
+        }
+
+    def pipeline_by_iid(self, index: int, iid: str) -> Optional[dict]:
+        for ref in self.refs(index):
+            pipeline = self.pipeline(index, ref)
+            if pipeline and pipeline['iid'] == str(iid):
+                return pipeline
+
+    def pipeline_jobs(self, pipeline: dict, retried: Optional[bool]) -> List[dict]:
+        index = pipeline['project_index']
+        pipeline_id = int(pipeline['iid'])
+        jobs = []
+        for j in range(self.jobs):
+            release = self.releases[j % len(self.releases)]
+            stage = self.STAGES[(j // len(self.releases)) % len(self.STAGES)]
+            distro = self.distros[(j // (len(self.releases) * len(self.STAGES))) % len(self.distros)]
+            attempts = 2 if self.retried_every and j % self.retried_every == 0 else 1
+            for attempt in range(attempts):
+                is_retried = attempt < attempts - 1
+                if retried is not None and is_retried != retried:
+                    continue
+                job_id = pipeline_id * 1000 + j * 2 + attempt
+                status = self.STATUSES[(index * 7 + j * 13 + attempt + pipeline['generation']) % len(self.STATUSES)]
+                jobs.append({
+                    'id': f"gid://gitlab/Ci::Build/{job_id}",
+                    'name': f"r{release}:{stage}:{distro}",
+                    'stage': {'name': stage},
+                    'createdAt': f"2026-10-{1 + (index + j) % 14:02d}T{j % 24:02d}:"
+                                 f"{pipeline['generation'] % 60:02d}:00Z",
+                    'detailedStatus': {'detailsPath': f"/{self.group}/{self.project_name(index)}/-/jobs/{job_id}",
+                                       'text': status},
+                    'status': status.upper(),
+                    'retried': is_retried,
+                })
+        return jobs
+
+    def project_node(self, index: int, pipeline_aliases: Dict[str, str]) -> dict:
+        """Project node of the group crawl, with the latest pipeline of each ref by alias and its non-retried jobs"""
+
+        project_node = {'name': self.project_name(index)}
+        for alias, ref in pipeline_aliases.items():
+            pipeline = self.pipeline(index, ref)
+            pipelines = []
+            if pipeline is not None:
+                pipelines.append({
+                    'id': pipeline['id'],
+                    'iid': pipeline['iid'],
+                    'ref': ref,
+                    'updatedAt': pipeline['updatedAt'],
+                    'jobs': {'nodes': self.pipeline_jobs(pipeline, False),
+                             'pageInfo': {'endCursor': None, 'hasNextPage': False}},
+                })
+            project_node[alias] = {'nodes': pipelines}
+        return project_node
+
+    def release_pipeline_aliases(self) -> Dict[str, str]:
+        """Release branches and main, by the alias a ReportBuilder of the same releases queries their pipelines as"""
+
+        from qubes_g2g_report.component import Component
+
+        return {
+            Component.branch_node_name(ref): ref
+            for ref in [Component.get_release_branch(release) for release in self.releases] + ['main']
+        }
+
+    def make_distros(self, builder) -> dict:
+        """Report model of the latest pipelines of the release branches, as resolved by a ReportBuilder of the
+        same releases, branch overrides aside"""
+
+        from qubes_g2g_report.component import Component
+
+        pipeline_aliases = self.release_pipeline_aliases()
+        components = [Component(self.project_node(index, pipeline_aliases)) for index in range(self.projects)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            return builder.resolve_distros(components, {release: {} for release in self.releases})
+
+    def builder_yaml(self, release: str) -> str:
+        lines = ['git:', '  baseurl: https://github.com', '  prefix: QubesOS/qubes-', 'components:']
+        for index in range(self.projects):
+            short_name = self.project_name(index).removeprefix('qubes-')
+            if self.overrides_every and index % self.overrides_every == 0:
+                lines += [f"  - {short_name}:", f"      branch: feature-{index}"]
+            else:
+                lines.append(f"  - {short_name}")
+        return "\n".join(lines) + "\n"
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Resolver:
+    MAXIMUM_PAGE_SIZE = 100
+    # Stand-in for GitLab complexity: one point per field, the cost of a page of
+    # projects growing with its size
+    PROJECTS_COMPLEXITY_DIVISOR = 10
+
+    def __init__(self, dataset: SyntheticGroup, complexity_limit: int = 250, seconds_per_project: float = 0.0):
+        self._complexity_limit = complexity_limit
+        self._dataset = dataset
+        self._seconds_per_project = seconds_per_project
+
+    @classmethod
+    def complexity(cls, selection: Optional[list]) -> int:
+        score = 0
+        for _, name, arguments, sub_selection in selection or []:
+            sub_score = cls.complexity(sub_selection)
+            if name == 'projects':
+                page_size = min(arguments.get('first') or cls.MAXIMUM_PAGE_SIZE, cls.MAXIMUM_PAGE_SIZE)
+                sub_score = sub_score * page_size // cls.PROJECTS_COMPLEXITY_DIVISOR
+            score += 1 + sub_score
+        return score
+
+    def _connection(self, count: int, get_items: Callable[[int, int], list], arguments: dict,
+                    resolve_node: Callable[[object, list], dict], selection: list) -> dict:
+        first = min(arguments.get('first') or self.MAXIMUM_PAGE_SIZE, self.MAXIMUM_PAGE_SIZE)
+        start = int(arguments['after']) if arguments.get('after') else 0
+        items = get_items(start, min(start + first, count))
+        result = {}
+        for alias, name, _, sub_selection in selection:
+            if name == 'nodes':
+                result[alias] = [resolve_node(item, sub_selection) for item in items]
+            elif name == 'pageInfo':
+                page_info = {
+                    'endCursor': str(start + len(items)) if items else None,
+                    'hasNextPage': start + first < count,
+                    'startCursor': str(start),
+                    'hasPreviousPage': start > 0,
+                }
+                result[alias] = {a: page_info.get(n) for a, n, _, _ in sub_selection}
+            elif name == 'count':
+                result[alias] = count
+        return result
+
+    def _plain(self, obj: dict, selection: list) -> dict:
+        result = {}
+        for alias, name, _, sub_selection in selection:
+            value = obj.get(name)
+            if sub_selection is not None and isinstance(value, dict):
+                value = self._plain(value, sub_selection)
+            result[alias] = value
+        return result
+
+    def _pipeline(self, pipeline: dict, selection: list) -> dict:
+        result = {}
+        for alias, name, arguments, sub_selection in selection:
+            if name == 'jobs':
+                jobs = self._dataset.pipeline_jobs(pipeline, arguments.get('retried'))
+                result[alias] = self._connection(len(jobs), lambda a, b: jobs[a:b], arguments, self._plain, sub_selection)
+            else:
+                result[alias] = pipeline.get(name)
+        return result
+
+    def _project(self, index: Optional[int], selection: list) -> Optional[dict]:
+        if index is None:
+            return
+        name = self._dataset.project_name(index)
+        result = {}
+        for alias, field, arguments, sub_selection in selection:
+            if field == 'pipelines':
+                pipeline = self._dataset.pipeline(index, arguments.get('ref'))
+                pipelines = [pipeline] if pipeline else []
+                result[alias] = self._connection(len(pipelines), lambda a, b: pipelines[a:b], arguments,
+                                                 self._pipeline, sub_selection)
+            elif field == 'pipeline':
+                pipeline = self._dataset.pipeline_by_iid(index, arguments.get('iid'))
+                result[alias] = self._pipeline(pipeline, sub_selection) if pipeline else None
+            elif field == 'name' or field == 'path':
+                result[alias] = name
+            elif field == 'fullPath':
+                result[alias] = f"{self._dataset.group}/{name}"
+            elif field == 'lastActivityAt':
+                result[alias] = f"2026-10-02T00:00:{self._dataset.generation(index) % 60:02d}Z"
+            else:
+                result[alias] = None
+        return result
+
+    def _group(self, selection: list) -> dict:
+        result = {}
+        for alias, name, arguments, sub_selection in selection:
+            if name == 'projects':
+                page_size = min(arguments.get('first') or self.MAXIMUM_PAGE_SIZE, self.MAXIMUM_PAGE_SIZE)
+                time.sleep(self._seconds_per_project * page_size)
+                result[alias] = self._connection(self._dataset.projects, lambda a, b: list(range(a, b)), arguments,
+                                                 self._project, sub_selection)
+            elif name == 'fullPath':
+                result[alias] = self._dataset.group
+            else:
+                result[alias] = None
+        return result
+
+    def resolve(self, query: str) -> dict:
+        fields = GraphQLParser(query).parse()
+        score = self.complexity(fields)
+        if score > self._complexity_limit:
+            raise QueryError(f"Query has complexity of {score}, which exceeds max complexity of {self._complexity_limit}")
+
+        data = {}
+        for alias, name, arguments, selection in fields:
+            if name == 'group':
+                is_group = arguments.get('fullPath', '').lower() == self._dataset.group.lower()
+                data[alias] = self._group(selection) if is_group else None
+            elif name == 'project':
+                data[alias] = self._project(self._dataset.project_index(arguments.get('fullPath', '')), selection)
+            elif name == 'queryComplexity':
+                data[alias] = self._plain({'score': score, 'limit': self._complexity_limit}, selection)
+            else:
+                data[alias] = None
+        return data
+
+
+class ServerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.requests: Dict[str, int] = {}
+
+    def add(self, kind: str, size: int):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes += size
+
+    def reset(self):
+        with self._lock:
+            self.bytes = 0
+            self.requests = {}
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {'requests': sum(self.requests.values()), 'requests_by_kind': dict(self.requests),
+                    'bytes': self.bytes}
+
+
+class FakeGitlabServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, dataset: SyntheticGroup, port: int = 0, latency: float = 0.0, complexity_limit: int = 250,
+                 seconds_per_project: float = 0.0):
+        super().__init__(('127.0.0.1', port), FakeGitlabRequestHandler)
+        self.dataset = dataset
+        # GraphQL requests answered before failing every following one, to simulate an outage
+        self.fail_after: Optional[int] = None
+        self._graphql_requests = 0
+        self._graphql_requests_lock = threading.Lock()
+        self.latency = latency
+        self.resolver = Resolver(dataset, complexity_limit, seconds_per_project)
+        self.stats = ServerStats()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    @property
+    def builder_config_url(self) -> str:
+        return f"{self.url}/example-configs/qubes-os-r{{}}.yml"
+
+    def should_fail(self) -> bool:
+        with self._graphql_requests_lock:
+            self._graphql_requests += 1
+            return self.fail_after is not None and self._graphql_requests > self.fail_after
+
+    def reset_failures(self, fail_after: Optional[int] = None):
+        with self._graphql_requests_lock:
+            self._graphql_requests = 0
+            self.fail_after = fail_after
+
+    def start(self) -> "FakeGitlabServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeGitlabRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, body: bytes, content_type: str, kind: str, headers: Optional[dict] = None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.add(kind, len(body))
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        match = re.search(r'qubes-os-r([0-9.]+)\.yml$', self.path)
+        if not match:
+            return self._send(404, b'Not found', 'text/plain', 'other')
+        body = self.server.dataset.builder_yaml(match.group(1)).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', 'text/plain', 'yaml_not_modified', {'ETag': etag})
+        return self._send(200, body, 'text/plain', 'yaml', {'ETag': etag})
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        if self.server.should_fail():
+            body = json.dumps({'errors': [{'message': 'Internal server error'}]}).encode()
+            return self._send(200, body, 'application/json', 'graphql_failed')
+        try:
+            body = json.dumps({'data': self.server.resolver.resolve(payload['query'])}).encode()
+        except (KeyError, ValueError) as e:
+            body = json.dumps({'errors': [{'message': str(e)}]}).encode()
+        return self._send(200, body, 'application/json', 'graphql',
+                          {'RateLimit-Limit': '2000', 'RateLimit-Remaining': '2000'})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a synthetic QubesOS group")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=30, help="Jobs per pipeline")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every response, in seconds")
+    parser.add_argument("--complexity-limit", type=int, default=250)
+    parser.add_argument("--seconds-per-project", type=float, default=0.0,
+                        help="Delay added to group crawl responses for each project in the page")
+    args = parser.parse_args()
+
+    server = FakeGitlabServer(SyntheticGroup(args.projects, args.jobs), args.port, args.latency,
+                              args.complexity_limit, args.seconds_per_project)
+    print(f"Serving on {server.url}, builder configuration at {server.builder_config_url}")
+    server.serve_forever()
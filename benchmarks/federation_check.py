@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Report of several GitLab sources, each served by a local GitLab stand-in
+
+The first source is the upstream group, the others mirror its projects under
+another group and add projects of their own. Sources are crawled concurrently,
+so the run should take about as long as the slowest source, e.g.:
+
+    python3 benchmarks/federation_check.py --scale 100x30 --sources 3 --latency 0.05
+"""
+
+
+import argparse
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+
+
+from pathlib import Path
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_DIR))
+
+from benchmarks.fake_gitlab import FakeGitlabServer, SyntheticGroup
+
+
+def run_report(servers: list, releases: list, work_dir: Path, **kwargs) -> float:
+    from qubes_g2g_report.gitlab_source import GitlabSource
+    from qubes_g2g_report.report_builder import ReportBuilder
+
+    sources_file = work_dir / 'sources.yml'
+    sources_file.write_text(json.dumps({'sources': [
+        {'name': f"source{index}", 'url': server.url, 'group': server.dataset.group}
+        for index, server in enumerate(servers)
+    ]}))
+    builder = ReportBuilder(servers[0].url, releases, builder_config_url=servers[0].builder_config_url,
+                            sources=GitlabSource.load(sources_file), **kwargs)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.generate_report()
+    return time.perf_counter() - start
+
+
+def run_check(args) -> dict:
+    projects, jobs = [int(value) for value in args.scale.split('x')]
+    servers = [
+        FakeGitlabServer(SyntheticGroup(projects + index * args.extra_projects, jobs, releases=args.release,
+                                        group='QubesOS' if index == 0 else f"qubes-mirror{index}"),
+                         latency=args.latency).start()
+        for index in range(args.sources)
+    ]
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            work_dir = Path(work_dir)
+            # Alone, each source is crawled with the default --jobs
+            single_times = [
+                run_report([server], args.release, work_dir, output_dir=work_dir / f"single{index}")
+                for index, server in enumerate(servers)
+            ]
+            for server in servers:
+                server.stats.reset()
+
+            federated_time = run_report(servers, args.release, work_dir, output_dir=work_dir / 'federated')
+            # Sharded output for status.json, and the history store, whose job ids repeat across instances
+            run_report(servers, args.release, work_dir, output_dir=work_dir / 'federated', sharded=True,
+                       history_db=work_dir / 'history.sqlite')
+            with open(work_dir / 'federated' / 'status.json') as f:
+                status = json.load(f)
+            with contextlib.closing(sqlite3.connect(str(work_dir / 'history.sqlite'))) as connection:
+                history_jobs = dict(connection.execute("SELECT source, COUNT(*) FROM jobs GROUP BY source"))
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    cells_by_source = {}
+    links_match_source = True
+    for components in status['distros'].values():
+        for component_status in components.values():
+            for release in args.release:
+                release_status = component_status.get(release)
+                if release_status is None:
+                    continue
+                source_index = int(release_status['source'].removeprefix('source'))
+                cells_by_source[release_status['source']] = cells_by_source.get(release_status['source'], 0) + 1
+                links_match_source &= all(release_status[stage]['url'].startswith(servers[source_index].url)
+                                          for stage in ['build', 'install', 'repro'] if stage in release_status)
+
+    return {
+        'sources': args.sources,
+        'projects_per_source': [projects + index * args.extra_projects for index in range(args.sources)],
+        'latency_seconds': args.latency,
+        'single_source_seconds': [round(single_time, 3) for single_time in single_times],
+        'federated_seconds': round(federated_time, 3),
+        # Of both federated runs
+        'requests_per_source': [server.stats.as_dict()['requests'] for server in servers],
+        'cells_by_source': cells_by_source,
+        'history_jobs_by_source': history_jobs,
+        'links_match_source': links_match_source,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", default="50x30", help="PROJECTSxJOBS of the upstream group, jobs being per pipeline")
+    parser.add_argument("--sources", type=int, default=2, help="Number of sources, the first one being upstream")
+    parser.add_argument("--extra-projects", type=int, default=10,
+                        help="Projects each mirror has in addition to the previous source")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every GitLab stand-in response")
+    parser.add_argument("--release", action="append", help="Release numbers (repeatable, default: 4.2 and 4.3)")
+    args = parser.parse_args()
+    args.release = args.release or ['4.2', '4.3']
+
+    result = run_check(args)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result['links_match_source'] and len(result['cells_by_source']) == args.sources else 1)
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Run filling the response cache against a local GitLab stand-in, then the same run with --offline
+
+The stand-in is set up so that the live run adapts its queries: crawl pages are
+shrunk after slow responses and batches of branch overrides are split after
+complexity errors. The offline run has to replay the same queries from the
+cache, and write the same report, e.g.:
+
+    python3 benchmarks/offline_check.py --scale 100x30 --seconds-per-project 0.01 --complexity-limit 120
+"""
+
+
+import argparse
+import contextlib
+import filecmp
+import io
+import json
+import re
+import sys
+import tempfile
+
+
+from pathlib import Path
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_DIR))
+
+from benchmarks.fake_gitlab import FakeGitlabServer, SyntheticGroup
+
+
+def run_report(server: FakeGitlabServer, releases: list, output_dir: Path, target_duration: float,
+               **kwargs) -> dict:
+    from qubes_g2g_report import report_builder
+    from qubes_g2g_report.page_size import AdaptivePageSize
+
+    class PageSize(AdaptivePageSize):
+        # Pages of the stand-in are fast, a short target duration makes response times matter
+        def __init__(self, initial: int = 20, **page_size_kwargs):
+            super().__init__(initial, target_duration=target_duration, **page_size_kwargs)
+
+    report_builder.AdaptivePageSize = PageSize
+    server.stats.reset()
+    builder = report_builder.ReportBuilder(server.url, releases, builder_config_url=server.builder_config_url,
+                                           output_dir=output_dir, **kwargs)
+    output = io.StringIO()
+    error = io.StringIO()
+    succeeded = True
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(error):
+        try:
+            builder.generate_report()
+        except RuntimeError:
+            succeeded = False
+    lines = output.getvalue().splitlines()
+    return {
+        'succeeded': succeeded,
+        'graphql_requests': server.stats.requests.get('graphql', 0),
+        # More requests than pages of the initial size when pages were shrunk
+        'crawl_requests': sum(int(re.search(r'in (\d+) GraphQL request', line).group(1))
+                              for line in lines if line.startswith('* Crawled ')),
+        'split_batches': sum('too large, splitting' in line for line in lines),
+        'error': error.getvalue().strip().splitlines()[-1] if not succeeded and error.getvalue().strip() else None,
+    }
+
+
+def run_check(args) -> dict:
+    projects, jobs = [int(value) for value in args.scale.split('x')]
+    server = FakeGitlabServer(SyntheticGroup(projects, jobs, releases=args.release),
+                              complexity_limit=args.complexity_limit,
+                              seconds_per_project=args.seconds_per_project).start()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            work_dir = Path(work_dir)
+            live = run_report(server, args.release, work_dir / 'live', args.target_duration,
+                              cache_dir=work_dir / 'cache', page_size=args.page_size)
+            offline = run_report(server, args.release, work_dir / 'offline', args.target_duration,
+                                 cache_dir=work_dir / 'cache', page_size=args.page_size, offline=True)
+            identical = live['succeeded'] and offline['succeeded'] and all(
+                filecmp.cmp(work_dir / 'live' / name, work_dir / 'offline' / name, shallow=False)
+                for name in ['index.md', 'index.html'])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        'projects': projects,
+        'jobs_per_pipeline': jobs,
+        'live': live,
+        'offline': offline,
+        'identical_report': identical,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", default="100x30", help="PROJECTSxJOBS of the synthetic group, jobs being per pipeline")
+    parser.add_argument("--page-size", type=int, default=20, help="Initial page size of the group crawl")
+    parser.add_argument("--seconds-per-project", type=float, default=0.01,
+                        help="Delay added to group crawl responses for each project in the page")
+    parser.add_argument("--target-duration", type=float, default=0.1,
+                        help="Response time the page size of the crawl is adapted to")
+    parser.add_argument("--complexity-limit", type=int, default=120,
+                        help="Maximum query complexity of the stand-in, low enough to split batches")
+    parser.add_argument("--release", action="append", help="Release numbers (repeatable, default: 4.2 and 4.3)")
+    args = parser.parse_args()
+    args.release = args.release or ['4.2', '4.3']
+
+    result = run_check(args)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result['identical_report'] else 1)
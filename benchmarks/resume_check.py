@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Runs failing after some GraphQL requests, resumed from their checkpoint, against a local GitLab stand-in
+
+Each resumed report is compared with the one of a run without failure, and the
+GraphQL requests of the resumed run with the ones left to do, e.g.:
+
+    python3 benchmarks/resume_check.py --scale 200x30 --fail-at 0.25 --fail-at 0.9
+"""
+
+
+import argparse
+import contextlib
+import filecmp
+import io
+import json
+import sys
+import tempfile
+
+
+from pathlib import Path
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_DIR))
+
+from benchmarks.fake_gitlab import FakeGitlabServer, SyntheticGroup
+
+
+def run_report(server: FakeGitlabServer, releases: list, output_dir: Path, **kwargs) -> bool:
+    """Whether the report was written, with the GraphQL requests it made in server.stats"""
+
+    from qubes_g2g_report.report_builder import ReportBuilder
+
+    server.stats.reset()
+    builder = ReportBuilder(server.url, releases, builder_config_url=server.builder_config_url, output_dir=output_dir,
+                            **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        try:
+            builder.generate_report()
+        except RuntimeError:
+            return False
+    return True
+
+
+def run_check(args) -> dict:
+    projects, jobs = [int(value) for value in args.scale.split('x')]
+    server = FakeGitlabServer(SyntheticGroup(projects, jobs, releases=args.release)).start()
+    scenarios = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            work_dir = Path(work_dir)
+            run_report(server, args.release, work_dir / 'reference')
+            reference_requests = server.stats.requests.get('graphql', 0)
+
+            for fail_at in args.fail_at or [0.25, 0.5, 0.9]:
+                output_dir = work_dir / f"resumed-{fail_at}"
+                checkpoint_file = work_dir / f"checkpoint-{fail_at}.jsonl"
+                fail_after = max(1, int(reference_requests * fail_at))
+                server.reset_failures(fail_after)
+                failed = not run_report(server, args.release, output_dir, checkpoint_file=checkpoint_file)
+                failed_requests = server.stats.requests.get('graphql', 0)
+                checkpoint_size = checkpoint_file.stat().st_size if checkpoint_file.exists() else 0
+
+                server.reset_failures()
+                succeeded = run_report(server, args.release, output_dir, checkpoint_file=checkpoint_file, resume=True)
+                resumed_requests = server.stats.requests.get('graphql', 0)
+
+                scenarios.append({
+                    'fail_after_requests': fail_after,
+                    'failed': failed,
+                    'checkpoint_bytes': checkpoint_size,
+                    'resumed': succeeded,
+                    # Requests answered before the failure, then made by the resumed run
+                    'failed_run_requests': failed_requests,
+                    'resumed_run_requests': resumed_requests,
+                    'checkpoint_removed': not checkpoint_file.exists(),
+                    'identical_report': succeeded and all(
+                        filecmp.cmp(work_dir / 'reference' / name, output_dir / name, shallow=False)
+                        for name in ['index.md', 'index.html']),
+                })
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        'projects': projects,
+        'jobs_per_pipeline': jobs,
+        'reference_requests': reference_requests,
+        'scenarios': scenarios,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", default="200x30", help="PROJECTSxJOBS of the synthetic group, jobs being per pipeline")
+    parser.add_argument("--fail-at", type=float, action="append",
+                        help="Fraction of the GraphQL requests of a full run after which GitLab fails "
+                             "(repeatable, default: 0.25, 0.5 and 0.9)")
+    parser.add_argument("--release", action="append", help="Release numbers (repeatable, default: 4.2 and 4.3)")
+    args = parser.parse_args()
+    args.release = args.release or ['4.2', '4.3']
+
+    result = run_check(args)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if all(scenario['failed'] and scenario['identical_report'] and scenario['checkpoint_removed']
+                      for scenario in result['scenarios']) else 1)
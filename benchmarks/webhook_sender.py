@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Local stand-in for GitLab webhooks, sending pipeline and job events of a synthetic group
+
+Without --url, a local GitLab stand-in and a ReportWatcher are started, pipelines of
+--changed projects are updated and sent as webhook events, and the resulting report is
+compared with the one of a full run, e.g.:
+
+    python3 benchmarks/webhook_sender.py --scale 200x30 --changed 10
+
+With --url, events are sent to a running g2g-serve.py instead.
+"""
+
+
+import argparse
+import contextlib
+import filecmp
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+import requests
+
+
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_DIR))
+
+from benchmarks.fake_gitlab import FakeGitlabServer, SyntheticGroup
+
+
+def _webhook_time(value: str) -> str:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M:%S UTC')
+
+
+def _job_id(job: dict) -> int:
+    return int(job['id'].rsplit('/', 1)[-1])
+
+
+def pipeline_event(dataset: SyntheticGroup, index: int, ref: str, gitlab_url: str) -> Optional[dict]:
+    """Payload of a 'Pipeline Hook' event for the latest pipeline of a ref"""
+
+    pipeline = dataset.pipeline(index, ref)
+    if pipeline is None:
+        return
+    project_name = dataset.project_name(index)
+    return {
+        'object_kind': 'pipeline',
+        'object_attributes': {
+            'id': int(pipeline['iid']),
+            'iid': int(pipeline['iid']),
+            'ref': ref,
+            'status': pipeline['status'].lower(),
+            'created_at': _webhook_time(pipeline['createdAt']),
+        },
+        'project': {
+            'name': project_name,
+            'path_with_namespace': f"{dataset.group}/{project_name}",
+            'web_url': f"{gitlab_url}/{dataset.group}/{project_name}",
+        },
+        'builds': [
+            {
+                'id': _job_id(job),
+                'name': job['name'],
+                'stage': job['stage']['name'],
+                'status': job['detailedStatus']['text'],
+                'created_at': _webhook_time(job['createdAt']),
+            }
+            for job in dataset.pipeline_jobs(pipeline, None)
+        ],
+    }
+
+
+def job_events(dataset: SyntheticGroup, index: int, ref: str, gitlab_url: str) -> List[dict]:
+    """Payloads of 'Job Hook' events for the jobs of the latest pipeline of a ref"""
+
+    pipeline = dataset.pipeline(index, ref)
+    if pipeline is None:
+        return []
+    project_name = dataset.project_name(index)
+    return [
+        {
+            'object_kind': 'build',
+            'ref': ref,
+            'build_id': _job_id(job),
+            'build_name': job['name'],
+            'build_stage': job['stage']['name'],
+            'build_status': job['detailedStatus']['text'],
+            'build_created_at': _webhook_time(job['createdAt']),
+            'pipeline_id': int(pipeline['iid']),
+            'project_name': f"{dataset.group} / {project_name}",
+            'repository': {
+                'name': project_name,
+                'homepage': f"{gitlab_url}/{dataset.group}/{project_name}",
+            },
+        }
+        for job in dataset.pipeline_jobs(pipeline, None)
+    ]
+
+
+def send_event(session: requests.Session, url: str, event: str, payload: dict, token: Optional[str] = None) -> dict:
+    headers = {'X-Gitlab-Event': event}
+    if token is not None:
+        headers['X-Gitlab-Token'] = token
+    response = session.post(url, json=payload, headers=headers, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def send_events(url: str, dataset: SyntheticGroup, indexes, job_hooks: bool, token: Optional[str] = None,
+                gitlab_url: str = "https://gitlab.com") -> int:
+    count = 0
+    with requests.Session() as session:
+        for index in indexes:
+            for ref in dataset.refs(index):
+                if job_hooks:
+                    for payload in job_events(dataset, index, ref, gitlab_url):
+                        send_event(session, url, 'Job Hook', payload, token)
+                        count += 1
+                else:
+                    payload = pipeline_event(dataset, index, ref, gitlab_url)
+                    if payload is not None:
+                        send_event(session, url, 'Pipeline Hook', payload, token)
+                        count += 1
+    return count
+
+
+def wait_for_renders(url: str, renders: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if requests.get(f"{url}/healthz", timeout=5).json()['renders'] >= renders:
+            return
+        time.sleep(0.05)
+    raise TimeoutError(f"Report was not rendered {renders} time(s) within {timeout}s")
+
+
+def run_check(args) -> dict:
+    from qubes_g2g_report.report_builder import ReportBuilder
+    from qubes_g2g_report.watch import ReportWatcher
+
+    projects, jobs = [int(value) for value in args.scale.split('x')]
+    dataset = SyntheticGroup(projects, jobs, releases=args.release)
+    server = FakeGitlabServer(dataset, latency=args.latency).start()
+
+    def make_builder(output_dir: Path) -> ReportBuilder:
+        return ReportBuilder(server.url, args.release,
+                             builder_config_url=server.builder_config_url, output_dir=output_dir)
+
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            work_dir = Path(work_dir)
+            watcher = ReportWatcher(make_builder(work_dir / 'watch'), webhook_secret='secret', debounce=args.debounce,
+                                    resync_interval=3600)
+            listener = watcher.make_server('127.0.0.1', 0)
+            url = f"http://127.0.0.1:{listener.server_address[1]}"
+            with contextlib.redirect_stdout(io.StringIO()):
+                threading.Thread(target=listener.serve_forever, daemon=True).start()
+                watcher.full_resync()
+
+                dataset.bump(range(min(args.changed, projects)))
+                server.stats.reset()
+                start = time.perf_counter()
+                events_count = send_events(f"{url}/", dataset, range(min(args.changed, projects)), args.job_hooks,
+                                           token='secret', gitlab_url=server.url)
+                wait_for_renders(url, 2)
+                webhook_time = time.perf_counter() - start
+                listener.shutdown()
+                listener.server_close()
+
+                start = time.perf_counter()
+                make_builder(work_dir / 'full').generate_report()
+                full_time = time.perf_counter() - start
+
+            identical = all(filecmp.cmp(work_dir / 'watch' / name, work_dir / 'full' / name, shallow=False)
+                            for name in ['index.md', 'index.html'])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        'projects': projects,
+        'jobs_per_pipeline': jobs,
+        'changed_projects': args.changed,
+        'events': events_count,
+        'webhook_update_seconds': round(webhook_time, 3),
+        'full_run_seconds': round(full_time, 3),
+        'identical_report': identical,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Webhook listener of a running g2g-serve.py")
+    parser.add_argument("--token", help="Value of the X-Gitlab-Token header")
+    parser.add_argument("--gitlab", default="https://gitlab.com", help="GitLab instance the events claim to come from")
+    parser.add_argument("--scale", default="50x30", help="PROJECTSxJOBS of the synthetic group, jobs being per pipeline")
+    parser.add_argument("--changed", type=int, default=5, help="Number of projects to send events for")
+    parser.add_argument("--job-hooks", action="store_true", help="Send one 'Job Hook' event per job instead of "
+                                                                 "one 'Pipeline Hook' event per pipeline")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every GitLab stand-in response")
+    parser.add_argument("--debounce", type=float, default=0.2)
+    parser.add_argument("--release", action="append", help="Release numbers (repeatable, default: 4.2 and 4.3)")
+    args = parser.parse_args()
+    args.release = args.release or ['4.2', '4.3']
+
+    if args.url:
+        projects, jobs = [int(value) for value in args.scale.split('x')]
+        dataset = SyntheticGroup(projects, jobs, releases=args.release)
+        dataset.bump(range(min(args.changed, projects)))
+        events_count = send_events(args.url, dataset, range(min(args.changed, projects)), args.job_hooks, args.token,
+                                   args.gitlab)
+        print(f"Sent {events_count} event(s)")
+        sys.exit(0)
+
+    result = run_check(args)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result['identical_report'] else 1)
@@ -20,29 +20,37 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+
 import argparse
-import os
 import sys
 
 
 from pathlib import Path
-from qubes_g2g_report.report_builder import ReportBuilder
+from qubes_g2g_report.cli import add_common_arguments, build_report_builder
 
 
 if __name__ == '__main__':
     try:
         parser = argparse.ArgumentParser()
-        parser.add_argument("--gitlab", default="https://gitlab.com", help="Gitlab instance URL")
-        parser.add_argument("--current-release",required=True, help="Current QubesOS release number")
-        parser.add_argument("--next-release", required=True, help="Next QubesOS release number")
+        add_common_arguments(parser)
+        parser.add_argument("--offline", action="store_true",
+                            help="Build the report from cached responses only, without network access")
+        parser.add_argument("--checkpoint-file", type=Path,
+                            help="Journal crawled pages and resolved components to this file, removed once the report "
+                                 "is written")
+        parser.add_argument("--resume", action="store_true",
+                            help="Continue the run journaled in --checkpoint-file instead of starting from scratch")
+        parser.add_argument("--from-history", action="store_true",
+                            help="Build the report from the last run saved in --history-db, without querying GitLab")
         args = parser.parse_args()
-
-        gitlab_token = os.environ.get('GITLAB_API_TOKEN')
-        if gitlab_token is None:
-            gitlab_token_file = Path('~/.gitlab-token').expanduser()
-            if gitlab_token_file.is_file():
-                gitlab_token = gitlab_token_file.read_text().strip()
-
-        ReportBuilder(args.gitlab, args.current_release, args.next_release, gitlab_token).generate_report()
+        if args.from_history and args.history_db is None:
+            parser.error("--from-history requires --history-db")
+        if args.offline and args.cache_dir is None:
+            parser.error("--offline requires --cache-dir")
+        if args.resume and args.checkpoint_file is None:
+            parser.error("--resume requires --checkpoint-file")
+
+        build_report_builder(parser, args, offline=args.offline, checkpoint_file=args.checkpoint_file,
+                             resume=args.resume, from_history=args.from_history).generate_report()
     except RuntimeError:
         sys.exit(1)
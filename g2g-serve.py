@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+
+import argparse
+import os
+import sys
+
+
+from qubes_g2g_report.cli import add_common_arguments, build_report_builder
+from qubes_g2g_report.watch import ReportWatcher
+
+
+if __name__ == '__main__':
+    try:
+        parser = argparse.ArgumentParser(description="Keep the report up to date from GitLab pipeline and job webhooks")
+        add_common_arguments(parser)
+        parser.add_argument("--listen", default="127.0.0.1", help="Address the webhook listener binds to")
+        parser.add_argument("--port", type=int, default=8080, help="Port of the webhook listener")
+        parser.add_argument("--debounce", type=float, default=5.0,
+                            help="Seconds without webhook events to wait for before rendering the report")
+        parser.add_argument("--max-render-delay", type=float, default=60.0,
+                            help="Maximum seconds between a webhook event and the rendering of the report, "
+                                 "while events keep coming within --debounce")
+        parser.add_argument("--resync-interval", type=float, default=3600.0,
+                            help="Seconds between full resyncs, in case webhook events were missed")
+        args = parser.parse_args()
+
+        # Secret token set in the GitLab webhook settings
+        webhook_secret = os.environ.get('GITLAB_WEBHOOK_SECRET')
+
+        ReportWatcher(build_report_builder(parser, args), webhook_secret=webhook_secret, debounce=args.debounce,
+                      max_render_delay=args.max_render_delay,
+                      resync_interval=args.resync_interval).serve(args.listen, args.port)
+    except RuntimeError:
+        sys.exit(1)
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import os
+import sys
+import threading
+
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class CheckpointJournal:
+    """Append-only journal of the pages and projects fetched by a run, replayed by --resume after a failure
+
+    The journal is made of JSON lines: a header identifying the run, then one record per completed
+    group page, with its end cursor and reduced project nodes, and one record per round of projects
+    queried on their own, e.g. branch overrides. A line cut short by a crash is dropped on resume.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, header: dict):
+        self.path = Path(path)
+        self._header = dict(header, version=self.VERSION)
+        self._lock = threading.Lock()
+        self._file = None
+        # Offsets of page records and page info of the last page, by source name
+        self._pages_offsets: Dict[str, List[int]] = {}
+        self._last_page_info: Dict[str, dict] = {}
+        # Project nodes by project name, by record kind and source name
+        self._projects: Dict[Tuple[str, str], Dict[str, Optional[dict]]] = {}
+
+    @classmethod
+    def open(cls, path: Path, header: dict, resume: bool) -> "CheckpointJournal":
+        """Open the journal of a run identified by header, keeping what a previous run journaled if resume is set"""
+
+        journal = cls(path, header)
+        valid_size = journal._load() if resume else 0
+        journal.path.parent.mkdir(parents=True, exist_ok=True)
+        if valid_size:
+            journal._file = open(journal.path, 'r+b')
+            journal._file.truncate(valid_size)
+            journal._file.seek(valid_size)
+        else:
+            journal._file = open(journal.path, 'wb')
+            journal._append(journal._header)
+        return journal
+
+    def _load(self) -> int:
+        """Index the records of an existing journal, return the size of its valid part, or 0 to start over"""
+
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            print(f"* No checkpoint in {self.path}, starting from scratch")
+            return 0
+        except OSError as e:
+            print(f"WARNING: Unable to read checkpoint {self.path}: {e}", file=sys.stderr)
+            return 0
+
+        with f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = None
+            if header != self._header:
+                print(f"* Checkpoint {self.path} is not one of this run, starting from scratch")
+                return 0
+
+            valid_size = f.tell()
+            pages_count = 0
+            projects_count = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Cut short by the failure of the previous run
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                if record['kind'] == 'page':
+                    self._pages_offsets.setdefault(record['source'], []).append(valid_size)
+                    self._last_page_info[record['source']] = record['pageInfo']
+                    pages_count += 1
+                else:
+                    self._projects.setdefault((record['kind'], record['source']), {}).update(record['projects'])
+                    projects_count += len(record['projects'])
+                valid_size += len(line)
+
+        print(f"* Resuming from checkpoint {self.path}: {pages_count} page(s) and {projects_count} project(s) "
+              f"already fetched")
+        return valid_size
+
+    def _append(self, record: dict):
+        line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+        with self._lock:
+            self._file.write(line)
+            # Flushed record by record, the journal has to survive the failure of the run
+            self._file.flush()
+
+    def get_pages(self, source_name: str) -> Iterator[List[dict]]:
+        """Yield the project nodes of the journaled pages of a source, reading one page at a time"""
+
+        offsets = self._pages_offsets.get(source_name, [])
+        if not offsets:
+            return
+        with open(self.path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                yield json.loads(f.readline())['projects']
+
+    def get_next_cursor(self, source_name: str) -> Tuple[bool, Optional[str]]:
+        """Whether the crawl of a source has pages left, and the cursor of the next one"""
+
+        page_info = self._last_page_info.get(source_name)
+        if page_info is None:
+            return True, None
+        return page_info['hasNextPage'], page_info['endCursor']
+
+    def get_projects(self, kind: str, source_name: str) -> Dict[str, Optional[dict]]:
+        return dict(self._projects.get((kind, source_name), {}))
+
+    def record_page(self, source_name: str, projects: List[dict], page_info: dict):
+        self._append({'kind': 'page', 'source': source_name,
+                      'pageInfo': {'endCursor': page_info['endCursor'], 'hasNextPage': page_info['hasNextPage']},
+                      'projects': projects})
+
+    def record_projects(self, kind: str, source_name: str, projects: Dict[str, Optional[dict]]):
+        self._append({'kind': kind, 'source': source_name, 'projects': projects})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Remove the journal once the run it belongs to succeeded"""
+
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
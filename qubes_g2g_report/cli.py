@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import argparse
+import os
+
+
+from pathlib import Path
+from qubes_g2g_report.gitlab_source import GitlabSource
+from qubes_g2g_report.report_builder import ReportBuilder
+from typing import Optional
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    """Options of the GitLab crawl and of the report, shared by g2g-report.py and g2g-serve.py"""
+
+    parser.add_argument("--gitlab", default="https://gitlab.com", help="Gitlab instance URL")
+    parser.add_argument("--group", default=GitlabSource.DEFAULT_GROUP, help="Gitlab group of the components")
+    parser.add_argument("--sources-file", type=Path,
+                        help="YAML file listing the name, url, group and token of several GitLab sources to "
+                             "crawl, instead of --gitlab and --group")
+    parser.add_argument("--current-release", help="Current QubesOS release number")
+    parser.add_argument("--next-release", help="Next QubesOS release number")
+    parser.add_argument("--release", action="append", default=[],
+                        help="Additional QubesOS release number, shown after the current and next releases "
+                             "(repeatable)")
+    parser.add_argument("--page-size", type=int, default=20,
+                        help="Initial number of projects per page of the group crawl, adjusted during the crawl")
+    parser.add_argument("--project-batch-size", type=int, default=10,
+                        help="Number of projects per batched GraphQL query")
+    parser.add_argument("--jobs", "-j", type=int, default=4,
+                        help="Maximum number of concurrent requests")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Maximum number of retries for rate limited or failed requests")
+    parser.add_argument("--builder-config-url", default=ReportBuilder.BUILDER_CONFIG_URL,
+                        help="URL of the QubesOS builder example configuration, '{}' is replaced by the release")
+    parser.add_argument("--builder-config-dir", type=Path,
+                        help="qubes-builderv2 checkout, or its example-configs directory, to read the builder "
+                             "configuration from instead of downloading it")
+    parser.add_argument("--output-dir", type=Path, default=Path("public"), help="Directory the report is written to")
+    parser.add_argument("--sharded", action="store_true",
+                        help="Write a page per distribution, an index loading them on demand, status.json and "
+                             "status.ndjson, with precompressed .gz and .br versions")
+    parser.add_argument("--cache-dir", type=Path, help="Directory used to cache HTTP responses between runs")
+    parser.add_argument("--cache-ttl", type=float, default=300,
+                        help="Maximum age in seconds of cached GraphQL responses")
+    parser.add_argument("--cache-max-size", type=int, default=256,
+                        help="Maximum size of the response cache in MiB")
+    parser.add_argument("--state-file", type=Path,
+                        help="File used to persist fetched project pipelines between runs")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch jobs of projects whose pipelines changed since the run saved in --state-file")
+    parser.add_argument("--metrics-file", type=Path, help="Write run metrics to this JSON file")
+    parser.add_argument("--metrics-prometheus-file", type=Path,
+                        help="Write run metrics to this file, in Prometheus textfile collector format")
+    parser.add_argument("--history-db", type=Path, help="SQLite database the job results of each run are appended to")
+
+
+def _read_gitlab_token() -> Optional[str]:
+    gitlab_token = os.environ.get('GITLAB_API_TOKEN')
+    if gitlab_token is None:
+        gitlab_token_file = Path('~/.gitlab-token').expanduser()
+        if gitlab_token_file.is_file():
+            gitlab_token = gitlab_token_file.read_text().strip()
+    return gitlab_token
+
+
+def build_report_builder(parser: argparse.ArgumentParser, args: argparse.Namespace, **kwargs) -> ReportBuilder:
+    """Check the options added by add_common_arguments() and build the ReportBuilder they describe
+
+    Options of a single script are passed to ReportBuilder as keyword arguments.
+    """
+
+    releases = list(dict.fromkeys(
+        release for release in [args.current_release, args.next_release, *args.release] if release))
+    if not releases:
+        parser.error("at least one of --current-release, --next-release or --release is required")
+    if args.incremental and args.state_file is None:
+        parser.error("--incremental requires --state-file")
+
+    gitlab_token = _read_gitlab_token()
+    if args.sources_file is not None:
+        try:
+            sources = GitlabSource.load(args.sources_file)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        sources = [GitlabSource.from_url(args.gitlab, args.group, gitlab_token)]
+
+    return ReportBuilder(args.gitlab, releases, gitlab_token,
+                         project_batch_size=args.project_batch_size, jobs=args.jobs,
+                         max_retries=args.max_retries, cache_dir=args.cache_dir, cache_ttl=args.cache_ttl,
+                         cache_max_size=args.cache_max_size * 1024 * 1024,
+                         state_file=args.state_file, incremental=args.incremental,
+                         builder_config_url=args.builder_config_url, builder_config_dir=args.builder_config_dir,
+                         output_dir=args.output_dir,
+                         metrics_file=args.metrics_file,
+                         metrics_prometheus_file=args.metrics_prometheus_file,
+                         sources=sources,
+                         page_size=args.page_size, history_db=args.history_db,
+                         sharded=args.sharded, **kwargs)
@@ -21,24 +21,38 @@
 
 
 import re
-import requests
+import sys
 
 
-from jinja2 import Template
 from qubes_g2g_report.enums.job_type import JobType
 from qubes_g2g_report.job import Job
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+
+BRANCH_NODE_NAME_ESCAPE_RE = re.compile(r'^[0-9]|[^A-Za-z0-9]')
 
 
 class Component:
-    def __init__(self, gitlab_project_node: dict):
-        self._gitlab_project_node = gitlab_project_node
+    __slots__ = ('name', 'source', '_pipelines_ids', '_pipelines_jobs')
+
+    RELEASE_JOB_TYPES = [JobType.BUILD, JobType.INSTALL, JobType.REPRO]
 
-        with open('templates/gitlab_query_pipeline.j2', 'r') as f:
-            self._gitlab_query_pipeline_template = Template(f.read())
+    def __init__(self, gitlab_project_node: dict, source: Optional[str] = None):
+        self.name: str = gitlab_project_node['name']
+        # Name of the GitLab source the project was crawled from
+        self.source = source
+        # Latest pipeline jobs, by pipeline alias. None when no pipeline was found for the alias.
+        self._pipelines_jobs: Dict[str, Optional[List[Job]]] = {}
+        self._pipelines_ids: Dict[str, Optional[int]] = {}
+        self.add_branch_pipelines(gitlab_project_node)
+
+    @staticmethod
+    def branch_node_name(branch_name: str) -> str:
+        """GraphQL alias of the pipelines of a branch, distinct for distinct branch names, e.g. release4_2e2"""
 
-        with open('templates/gitlab_query_project_pipeline.j2', 'r') as f:
-            self._gitlab_query_project_pipeline_template = Template(f.read())
+        # Letters and digits are kept, other bytes and a leading digit are escaped as _XX
+        return BRANCH_NODE_NAME_ESCAPE_RE.sub(
+            lambda match: "".join(f"_{byte:02x}" for byte in match.group().encode()), branch_name)
 
     def _get_pipeline_jobs(self, branch_node_name: str) -> Optional[List[Job]]:
         branch_pipeline_jobs = self._get_branch_pipeline_jobs(branch_node_name)
@@ -47,61 +61,151 @@ class Component:
         return self._get_branch_pipeline_jobs('main')
 
     def _get_branch_pipeline_jobs(self, branch_node_name: str) -> Optional[List[Job]]:
-        if branch_node_name in self._gitlab_project_node:
-            project_node = self._gitlab_project_node
-        else:
-            project_node = self._query_branch_pipelines(branch_node_name)
+        return self._pipelines_jobs.get(self.branch_node_name(branch_node_name))
+
+    @classmethod
+    def _parse_pipeline_jobs(cls, pipelines_node: dict) -> Optional[List[Job]]:
+        pipeline_current_release = pipelines_node['nodes']
+        if not pipeline_current_release:
+            return
+
+        jobs = []
+        for node in pipeline_current_release[0]['jobs']['nodes']:
+            job = Job(node, pipeline_current_release[0]['ref'])
+            if job.type in cls.RELEASE_JOB_TYPES:
+                jobs.append(job)
+        return jobs
+
+    @classmethod
+    def reduce_job_nodes(cls, job_nodes: List[dict], releases: List[str]) -> List[dict]:
+        """Build, install and repro jobs of the reported releases, the only ones shown in the report"""
+
+        reduced_job_nodes = []
+        for node in job_nodes:
+            release, job_type, _ = Job.parse_name(node['name'])
+            if job_type in cls.RELEASE_JOB_TYPES and release in releases:
+                # New dicts with the same key objects, decoders may allocate keys for each node
+                reduced_job_nodes.append({
+                    'name': node['name'],
+                    'createdAt': node['createdAt'],
+                    'detailedStatus': {
+                        'detailsPath': node['detailedStatus']['detailsPath'],
+                        'text': sys.intern(node['detailedStatus']['text']),
+                    },
+                })
+        return reduced_job_nodes
+
+    @classmethod
+    def reduce_project_node(cls, project_node: Optional[dict], releases: List[str]) -> Optional[dict]:
+        """Drop what the report does not use from a project node as returned by the GraphQL API"""
+
+        if not project_node:
+            return project_node
+
+        reduced_node = {}
+        for key, value in project_node.items():
+            if isinstance(value, dict) and value.get('nodes'):
+                pipeline_node = value['nodes'][0]
+                if 'jobs' in pipeline_node:
+                    pipeline_node = {
+                        'id': pipeline_node['id'],
+                        'iid': pipeline_node['iid'],
+                        'ref': pipeline_node['ref'],
+                        'updatedAt': pipeline_node.get('updatedAt'),
+                        # The page info is kept to fetch the remaining jobs of truncated pipelines
+                        'jobs': {
+                            'nodes': cls.reduce_job_nodes(pipeline_node['jobs']['nodes'], releases),
+                            'pageInfo': pipeline_node['jobs'].get('pageInfo', {}),
+                        },
+                    }
+                value = {'nodes': [pipeline_node]}
+            reduced_node[key] = value
+        return reduced_node
 
-        pipeline_current_release = project_node[re.sub('[^A-Za-z0-9]+', '', branch_node_name)]['nodes']
-        if pipeline_current_release:
-            return [Job(node, pipeline_current_release[0]['ref']) for node in pipeline_current_release[0]['jobs']['nodes']]
+    @staticmethod
+    def _parse_pipeline_id(pipelines_node: dict) -> Optional[int]:
+        if pipelines_node['nodes']:
+            # Global ID, e.g. gid://gitlab/Ci::Pipeline/1234
+            return int(str(pipelines_node['nodes'][0]['id']).rsplit('/', 1)[-1])
 
     @staticmethod
     def _get_release_jobs(pipeline_jobs: Optional[dict], release_number: str) -> Dict[JobType,Job]:
         distros = {}
         if pipeline_jobs:
             for job in pipeline_jobs:
-                if job.type in [JobType.BUILD, JobType.INSTALL, JobType.REPRO] and job.release == release_number:
+                if job.release == release_number:
                     distros.setdefault(job.distribution, {})
                     distros[job.distribution][job.type] = job
         return distros
 
-    @property
-    def name(self) -> str:
-        return self._gitlab_project_node['name']
-
     @property
     def short_name(self) -> str:
         return self.name.removeprefix('qubes-')
 
-    def get_current_release_pipeline(self, builder_configuration: Optional[dict]) -> Optional[dict]:
-        if builder_configuration and 'branch' in builder_configuration:
-            return self._get_pipeline_jobs(builder_configuration['branch'])
-        return self._get_pipeline_jobs('current')
+    @property
+    def key(self) -> Tuple[Optional[str], str]:
+        """Key of the component in the report model, a project may be crawled from several sources"""
+
+        return self.source, self.short_name
+
+    @staticmethod
+    def get_release_branch(release_number: str) -> str:
+        return f"release{release_number}"
+
+    def get_release_pipeline(self, release_number: str, builder_configuration: Optional[dict]) -> Optional[dict]:
+        branch_override = self.get_branch_override(builder_configuration)
+        if branch_override:
+            return self._get_pipeline_jobs(branch_override)
+        return self._get_pipeline_jobs(self.get_release_branch(release_number))
+
+    def get_release_jobs(self, release_number: str, builder_configuration: Optional[dict]) -> Dict[JobType,Job]:
+        return self._get_release_jobs(self.get_release_pipeline(release_number, builder_configuration), release_number)
+
+    def add_branch_pipelines(self, project_node: Optional[dict]):
+        if project_node:
+            for key, value in project_node.items():
+                if isinstance(value, dict) and 'nodes' in value and key not in self._pipelines_jobs:
+                    self._pipelines_jobs[key] = self._parse_pipeline_jobs(value)
+                    self._pipelines_ids[key] = self._parse_pipeline_id(value)
+
+    def update_pipeline(self, pipeline_alias: str, pipeline_id: int, jobs: List[Job]) -> bool:
+        """Replace the latest pipeline of an alias, unless a more recent one is already known"""
+
+        known_pipeline_id = self._pipelines_ids.get(pipeline_alias)
+        if known_pipeline_id is not None and pipeline_id < known_pipeline_id:
+            return False
+
+        self._pipelines_ids[pipeline_alias] = pipeline_id
+        self._pipelines_jobs[pipeline_alias] = [job for job in jobs if job.type in self.RELEASE_JOB_TYPES]
+        return True
+
+    def update_job(self, pipeline_alias: str, pipeline_id: int, job: Job) -> bool:
+        """Add or replace a job of the latest pipeline of an alias, return whether the component changed"""
+
+        known_pipeline_id = self._pipelines_ids.get(pipeline_alias)
+        if known_pipeline_id is not None and pipeline_id < known_pipeline_id:
+            return False
+        if known_pipeline_id != pipeline_id:
+            self.update_pipeline(pipeline_alias, pipeline_id, [])
+        if job.type not in self.RELEASE_JOB_TYPES:
+            return known_pipeline_id != pipeline_id
+
+        jobs = self._pipelines_jobs[pipeline_alias]
+        for index, known_job in enumerate(jobs):
+            if known_job.name == job.name:
+                # Events of a retried job may arrive after those of its new attempt
+                if job.creation_time < known_job.creation_time:
+                    return False
+                jobs[index] = job
+                break
+        else:
+            jobs.append(job)
+        return True
 
-    def get_next_release_pipeline(self, builder_configuration: Optional[dict]) -> Optional[dict]:
+    def has_branch_pipelines(self, branch_name: str) -> bool:
+        return self.branch_node_name(branch_name) in self._pipelines_jobs
+
+    @staticmethod
+    def get_branch_override(builder_configuration: Optional[dict]) -> Optional[str]:
         if builder_configuration and 'branch' in builder_configuration:
-            return self._get_pipeline_jobs(builder_configuration['branch'])
-        return self._get_pipeline_jobs('next')
-    
-    def get_current_release_jobs(self, release_number: str, builder_configuration: Optional[dict]) -> Dict[JobType,Job]:
-        return self._get_release_jobs(self.get_current_release_pipeline(builder_configuration), release_number)
-    
-    def get_next_release_jobs(self, release_number: str, builder_configuration: Optional[dict]) -> Dict[JobType,Job]:
-        return self._get_release_jobs(self.get_next_release_pipeline(builder_configuration), release_number)
-
-    def _query_branch_pipelines(self, branch_name: str) -> dict:
-        print(f"  -> Getting specific branch '{branch_name}' status")
-        headers = {"Content-Type": "application/json", }
-        query_pipeline = self._gitlab_query_pipeline_template.render(
-            release_name=re.sub('[^A-Za-z0-9]+', '', branch_name),
-            release_branch=branch_name
-        )
-        query_project_pipelines = self._gitlab_query_project_pipeline_template.render(
-            project_name = self.name,
-            pipelines = query_pipeline
-        )
-        r = requests.post('https://gitlab.com/api/graphql',
-                          headers=headers,
-                          json={"query": query_project_pipelines})
-        return r.json()['data']['project']
+            return builder_configuration['branch']
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import yaml
+
+
+from pathlib import Path
+from qubes_g2g_report.http_client import HttpClient
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+
+class GitlabSource:
+    """A GitLab instance and group whose projects are crawled, with its own connection pool and rate limit"""
+
+    __slots__ = ('group', 'http_client', 'name', 'token', 'url')
+
+    DEFAULT_GROUP = "QubesOS"
+
+    def __init__(self, name: str, url: str, group: str = DEFAULT_GROUP, token: Optional[str] = None):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.group = group.strip('/')
+        self.token = token
+        # Set by ReportBuilder
+        self.http_client: Optional[HttpClient] = None
+
+    @classmethod
+    def from_url(cls, url: str, group: str = DEFAULT_GROUP, token: Optional[str] = None) -> "GitlabSource":
+        """Source named after the host of its instance, e.g. 'gitlab.com'"""
+
+        return cls(urlsplit(url).netloc or url, url, group, token)
+
+    @property
+    def graphql_url(self) -> str:
+        return f"{self.url}/api/graphql"
+
+    def project_path(self, project_name: str) -> str:
+        return f"{self.group}/{project_name}"
+
+    def project_url(self, project_name: str) -> str:
+        return f"{self.url}/{self.project_path(project_name)}"
+
+    def job_url(self, job_path: str) -> str:
+        return f"{self.url}{job_path}"
+
+    def matches_project(self, project_path: str, project_url: Optional[str] = None) -> bool:
+        """Whether a project, e.g. of a webhook event, belongs to the group of this source"""
+
+        namespace = project_path.strip('/').rpartition('/')[0]
+        if namespace.lower() != self.group.lower():
+            return False
+        return project_url is None or urlsplit(project_url).netloc.lower() == urlsplit(self.url).netloc.lower()
+
+    @staticmethod
+    def _read_token(entry: dict) -> Optional[str]:
+        if entry.get('token'):
+            return str(entry['token'])
+        if entry.get('token_env'):
+            return os.environ.get(entry['token_env'])
+        if entry.get('token_file'):
+            return Path(entry['token_file']).expanduser().read_text().strip()
+
+    @classmethod
+    def load(cls, path: Path) -> List["GitlabSource"]:
+        """Read sources from a YAML file listing the name, url, group and token of each source, e.g.:
+
+            sources:
+              - name: gitlab.com
+                url: https://gitlab.com
+                group: QubesOS
+                token_file: ~/.config/qubes-g2g-report/gitlab-token
+              - name: mirror
+                url: https://gitlab.example.org
+                group: qubes-mirror
+                token_env: MIRROR_GITLAB_TOKEN
+        """
+
+        try:
+            with open(path, 'rb') as f:
+                raw = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError) as e:
+            raise ValueError(f"Unable to read sources file {path}: {e}")
+
+        entries = raw.get('sources') if isinstance(raw, dict) else raw
+        if not isinstance(entries, list) or not entries:
+            raise ValueError(f"No source in {path}")
+
+        sources = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not entry.get('url'):
+                raise ValueError(f"Source without url in {path}: {entry!r}")
+            try:
+                token = cls._read_token(entry)
+            except OSError as e:
+                raise ValueError(f"Unable to read token of source {entry['url']}: {e}")
+            source = cls.from_url(entry['url'], entry.get('group') or cls.DEFAULT_GROUP, token)
+            source.name = str(entry.get('name') or source.name)
+            if any(known_source.name == source.name for known_source in sources):
+                raise ValueError(f"Duplicate source name {source.name!r} in {path}")
+            sources.append(source)
+        return sources
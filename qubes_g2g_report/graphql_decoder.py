@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+
+
+from typing import Any, Callable, List
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def _find(document: Any, path: List[str]) -> Any:
+    for key in path:
+        if not isinstance(document, dict):
+            return
+        document = document.get(key)
+    return document
+
+
+def _decode_items(content: bytes, items_prefix: str, reduce_item: Callable[[Any], Any]) -> dict:
+    # Everything but the items, which are then decoded one at a time
+    builder = ijson.ObjectBuilder()
+    for prefix, event, value in ijson.parse(content, use_float=True):
+        if not prefix.startswith(items_prefix):
+            builder.event(event, value)
+
+    items = _find(builder.value, items_prefix.split('.')[:-1])
+    if isinstance(items, list):
+        items += (reduce_item(item) for item in ijson.items(content, items_prefix, use_float=True))
+    return builder.value
+
+
+def decode_graphql_response(content: bytes, items_prefix: str, reduce_item: Callable[[Any], Any]) -> dict:
+    """Decode a GraphQL response, reducing items as soon as they are decoded so that the whole
+    response never lives in memory as Python objects
+
+    items_prefix is either a list, e.g. 'data.group.projects.nodes.item', or a mapping whose values
+    are reduced, e.g. 'data' for queries made of aliased blocks. Without ijson, the response is
+    decoded at once and then reduced.
+    """
+
+    # Error responses are small, and may not have the expected shape
+    if ijson is not None and b'"errors"' not in content:
+        if items_prefix.endswith('.item'):
+            return _decode_items(content, items_prefix, reduce_item)
+        if items_prefix == 'data':
+            return {'data': {key: reduce_item(value) for key, value in ijson.kvitems(content, 'data', use_float=True)}}
+
+    document = json.loads(content)
+    path = items_prefix.split('.')
+    if path[-1] == 'item':
+        items = _find(document, path[:-1])
+        if isinstance(items, list):
+            items[:] = [reduce_item(item) for item in items]
+    else:
+        mapping = _find(document, path)
+        if isinstance(mapping, dict):
+            for key, value in mapping.items():
+                mapping[key] = reduce_item(value)
+    return document
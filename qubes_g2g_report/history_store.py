@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import sqlite3
+import threading
+import time
+
+
+from pathlib import Path
+from qubes_g2g_report.component import Component
+from qubes_g2g_report.enums.job_status import JobStatus
+from qubes_g2g_report.enums.job_type import JobType
+from qubes_g2g_report.job import Job
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class HistoryStore:
+    """SQLite history of the job results of each run"""
+
+    # Status text understood by Job, to rebuild jobs from the store
+    STATUS_TEXTS = {JobStatus.SUCCESS: 'success', JobStatus.FAILURE: 'failed', JobStatus.UNKNOWN: 'unknown'}
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            created_at REAL NOT NULL,
+            -- JSON list of the release numbers of the report
+            releases TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS components (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS distros (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        -- One row per GitLab job, the status being the last one seen
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            -- Name of the GitLab source, job ids are only unique within an instance
+            source TEXT NOT NULL,
+            gitlab_id INTEGER NOT NULL,
+            component_id INTEGER NOT NULL REFERENCES components(id),
+            distro_id INTEGER NOT NULL REFERENCES distros(id),
+            release TEXT NOT NULL,
+            stage INTEGER NOT NULL,
+            status INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            path TEXT NOT NULL,
+            UNIQUE (source, gitlab_id)
+        );
+        CREATE INDEX IF NOT EXISTS jobs_cell ON jobs (component_id, distro_id, release, stage, created_at);
+        -- Jobs shown by each run
+        CREATE TABLE IF NOT EXISTS run_jobs (
+            run_id INTEGER NOT NULL REFERENCES runs(id),
+            job_id INTEGER NOT NULL REFERENCES jobs(id),
+            PRIMARY KEY (run_id, job_id)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(self.SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    @staticmethod
+    def _job_id(job: Job) -> int:
+        # Details path of a job, e.g. /QubesOS/qubes-linux-kernel/-/jobs/1234
+        return int(job.path.rstrip('/').rsplit('/', 1)[-1])
+
+    def _get_ids(self, table: str, names: Iterable[str]) -> Dict[str, int]:
+        names = set(names)
+        self._connection.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(name,) for name in names])
+        return {name: row_id for row_id, name in self._connection.execute(f"SELECT id, name FROM {table}")
+                if name in names}
+
+    def record_run(self, distros: dict, releases: List[str]) -> int:
+        """Append the jobs of a run, as returned by ReportBuilder._get_distros(), in a single transaction"""
+
+        cells = [
+            (distro_name, component_details['component'], job)
+            for release in releases
+            for distro_name, components in distros[release].items() if distro_name is not None
+            for component_details in components.values()
+            for job in component_details['jobs'].values()
+        ]
+
+        with self._lock, self._connection:
+            run_id = self._connection.execute(
+                "INSERT INTO runs (created_at, releases) VALUES (?, ?)", (time.time(), json.dumps(releases))).lastrowid
+            component_ids = self._get_ids('components', {component.name for _, component, _ in cells})
+            distro_ids = self._get_ids('distros', {distro_name for distro_name, _, _ in cells})
+            self._connection.executemany(
+                "INSERT INTO jobs (source, gitlab_id, component_id, distro_id, release, stage, status, created_at,"
+                " branch, path)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (source, gitlab_id) DO UPDATE SET status = excluded.status",
+                [(component.source or '', self._job_id(job), component_ids[component.name], distro_ids[distro_name],
+                  job.release, job.type.value, job.status.value, job.creation_time.isoformat(), job.branch, job.path)
+                 for distro_name, component, job in cells])
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO run_jobs (run_id, job_id)"
+                " SELECT ?, id FROM jobs WHERE source = ? AND gitlab_id = ?",
+                [(run_id, component.source or '', self._job_id(job)) for _, component, job in cells])
+        return run_id
+
+    def get_last_run(self, releases: List[str]) -> Optional[int]:
+        row = self._connection.execute(
+            "SELECT id FROM runs WHERE releases = ? ORDER BY id DESC LIMIT 1", (json.dumps(releases),)).fetchone()
+        return row[0] if row else None
+
+    def _build_job(self, distro: str, release: str, stage: int, status: int, created_at: str, branch: str,
+                   path: str) -> Job:
+        return Job({
+            'name': f"r{release}:{JobType(stage).name.lower()}:{distro}",
+            'createdAt': created_at,
+            'detailedStatus': {'detailsPath': path, 'text': self.STATUS_TEXTS[JobStatus(status)]},
+        }, branch)
+
+    def load_distros(self, run_id: int) -> dict:
+        """Jobs of a run, in the format returned by ReportBuilder._get_distros()"""
+
+        releases, = self._connection.execute("SELECT releases FROM runs WHERE id = ?", (run_id,)).fetchone()
+        distros = {release: {} for release in json.loads(releases)}
+        components = {}
+        rows = self._connection.execute(
+            "SELECT jobs.source, components.name, distros.name, jobs.release, jobs.stage, jobs.status,"
+            " jobs.created_at, jobs.branch, jobs.path"
+            " FROM run_jobs"
+            " JOIN jobs ON jobs.id = run_jobs.job_id"
+            " JOIN components ON components.id = jobs.component_id"
+            " JOIN distros ON distros.id = jobs.distro_id"
+            " WHERE run_jobs.run_id = ?", (run_id,))
+        for source, component_name, distro_name, *job_row in rows:
+            component = components.get((source, component_name))
+            if component is None:
+                component = components[source, component_name] = Component({'name': component_name}, source)
+            job = self._build_job(distro_name, *job_row)
+            component_details = distros[job.release].setdefault(distro_name, {}).setdefault(
+                component.key, {'jobs': {}, 'component': component})
+            component_details['jobs'][job.type] = job
+        return distros
+
+    def _cell_filter(self, component_name: str, release: str, distro: str, stage: JobType,
+                     source: Optional[str]) -> Tuple[str, tuple]:
+        cell_filter = (" jobs.component_id = (SELECT id FROM components WHERE name = ?)"
+                       " AND jobs.distro_id = (SELECT id FROM distros WHERE name = ?)"
+                       " AND jobs.release = ? AND jobs.stage = ?")
+        parameters = (component_name, distro, release, stage.value)
+        if source is not None:
+            cell_filter += " AND jobs.source = ?"
+            parameters += (source,)
+        return cell_filter, parameters
+
+    def get_last_known_good(self, component_name: str, release: str, distro: str,
+                            stage: JobType = JobType.BUILD, source: Optional[str] = None) -> Optional[Job]:
+        """Most recent successful job of a component, release, distro and stage, of any source by default"""
+
+        cell_filter, parameters = self._cell_filter(component_name, release, distro, stage, source)
+        row = self._connection.execute(
+            "SELECT jobs.release, jobs.stage, jobs.status, jobs.created_at, jobs.branch, jobs.path FROM jobs"
+            f" WHERE {cell_filter} AND jobs.status = ? ORDER BY jobs.created_at DESC LIMIT 1",
+            parameters + (JobStatus.SUCCESS.value,)).fetchone()
+        if row:
+            return self._build_job(distro, *row)
+
+    def get_status_transitions(self, component_name: str, release: str, distro: str,
+                               stage: JobType = JobType.BUILD,
+                               source: Optional[str] = None) -> List[Tuple[Optional[JobStatus], Job]]:
+        """Jobs whose status differs from the previous job of the same component, release, distro and stage"""
+
+        cell_filter, parameters = self._cell_filter(component_name, release, distro, stage, source)
+        rows = self._connection.execute(
+            "SELECT previous_status, release, stage, status, created_at, branch, path FROM ("
+            " SELECT LAG(jobs.status) OVER (ORDER BY jobs.created_at) AS previous_status, jobs.release, jobs.stage,"
+            " jobs.status, jobs.created_at, jobs.branch, jobs.path"
+            f" FROM jobs WHERE {cell_filter})"
+            " WHERE previous_status IS NULL OR previous_status != status"
+            " ORDER BY created_at", parameters)
+        return [(JobStatus(previous_status) if previous_status is not None else None,
+                 self._build_job(distro, *row))
+                for previous_status, *row in rows]
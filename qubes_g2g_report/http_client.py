@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import random
+import requests
+import sys
+import threading
+import time
+
+
+from email.utils import parsedate_to_datetime
+from qubes_g2g_report.metrics import Metrics
+from qubes_g2g_report.response_cache import CachedResponse, ResponseCache
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from typing import Optional
+
+
+class OfflineCacheMiss(requests.RequestException):
+    pass
+
+
+class HttpClient:
+    RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+    RATE_LIMIT_LOW_WATERMARK = 1
+
+    def __init__(self, pool_size: int = 4, max_retries: int = 5, backoff_base: float = 1.0, backoff_cap: float = 60.0,
+                 timeout: float = 60.0, cache: Optional[ResponseCache] = None, offline: bool = False,
+                 metrics: Optional[Metrics] = None):
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+        self._cache = cache
+        self._max_retries = max(0, max_retries)
+        self._metrics = metrics
+        self._offline = offline
+        self._rate_limit_lock = threading.Lock()
+        self._rate_limit_reset: Optional[float] = None
+        self._timeout = timeout
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session = requests.Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return
+
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = self._parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self._backoff_cap, self._backoff_base * 2 ** attempt))
+
+    def _throttle(self):
+        with self._rate_limit_lock:
+            reset = self._rate_limit_reset
+        if reset is not None:
+            delay = reset - time.time()
+            if delay > 0:
+                print(f"  -> Rate limit almost reached, waiting {delay:.1f}s", file=sys.stderr)
+                time.sleep(min(delay, self._backoff_cap))
+
+    def _update_rate_limit(self, response: requests.Response):
+        remaining = response.headers.get("RateLimit-Remaining")
+        reset = response.headers.get("RateLimit-Reset")
+        with self._rate_limit_lock:
+            try:
+                if remaining is not None and reset is not None and int(remaining) <= self.RATE_LIMIT_LOW_WATERMARK:
+                    self._rate_limit_reset = float(reset)
+                else:
+                    self._rate_limit_reset = None
+            except ValueError:
+                self._rate_limit_reset = None
+
+    def _record_request(self, method: str, url: str, response: Optional[requests.Response], start: float,
+                        retries: int = 0, cached: bool = False):
+        if self._metrics is not None:
+            self._metrics.record_request(method, url,
+                                         response.status_code if response is not None else None,
+                                         time.perf_counter() - start,
+                                         len(response.content) if response is not None else 0,
+                                         retries=retries,
+                                         cached=cached)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self._timeout)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            self._throttle()
+            try:
+                response = self._session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self._max_retries:
+                    self._record_request(method, url, None, start, retries=attempt)
+                    raise
+                response = None
+            else:
+                self._update_rate_limit(response)
+                if response.status_code not in self.RETRY_STATUS_CODES or attempt >= self._max_retries:
+                    self._record_request(method, url, response, start, retries=attempt)
+                    return response
+
+            delay = self._backoff_delay(attempt, response)
+            reason = response.status_code if response is not None else "connection error"
+            print(f"  -> Request to {url} failed ({reason}), retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _build_cached_response(url: str, cache_key: str, cached: CachedResponse) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(cached.headers)
+        response._content = cached.body
+        response.encoding = "utf-8"
+        response.cache_key = cache_key
+        return response
+
+    def _get_cached(self, url: str, cache_key: str) -> Optional[CachedResponse]:
+        cached = self._cache.get(cache_key)
+        if cached is None and self._offline:
+            raise OfflineCacheMiss(f"No cached response for {url}")
+        return cached
+
+    def _serve_cached(self, method: str, url: str, cache_key: str, cached: CachedResponse) -> requests.Response:
+        start = time.perf_counter()
+        response = self._build_cached_response(url, cache_key, cached)
+        response.from_cache = True
+        self._record_request(method, url, response, start, cached=True)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET with conditional revalidation of cached responses using ETag/Last-Modified"""
+
+        if self._cache is None:
+            return self.request("GET", url, **kwargs)
+
+        cache_key = ResponseCache.key("GET", url)
+        cached = self._get_cached(url, cache_key)
+        if self._offline:
+            return self._serve_cached("GET", url, cache_key, cached)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        response = self.request("GET", url, headers=headers, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self._cache.touch(cache_key)
+            return self._build_cached_response(url, cache_key, cached)
+        if response.status_code == 200:
+            self._cache.put(cache_key, response.content, response.headers)
+            response.cache_key = cache_key
+        return response
+
+    def post(self, url: str, cache_ttl: Optional[float] = None, **kwargs) -> requests.Response:
+        """POST, reusing a cached response younger than cache_ttl seconds when set"""
+
+        if self._cache is None or cache_ttl is None:
+            return self.request("POST", url, **kwargs)
+
+        cache_key = self._post_cache_key(url, **kwargs)
+        if self._offline and self._cache.get(cache_key) is None:
+            timeout = self._cache.get(self._timeout_cache_key(cache_key))
+            if timeout is not None:
+                raise requests.ReadTimeout(timeout.body.decode())
+        cached = self._get_cached(url, cache_key)
+        if cached is not None and (self._offline or cached.is_fresh(cache_ttl)):
+            return self._serve_cached("POST", url, cache_key, cached)
+
+        try:
+            response = self.request("POST", url, **kwargs)
+        except requests.ReadTimeout as e:
+            # Kept apart from responses, only for an offline replay to time out, and split the query, the same way
+            self._cache.put(self._timeout_cache_key(cache_key), str(e).encode(), {})
+            raise
+        if response.ok:
+            self._cache.put(cache_key, response.content, response.headers)
+            response.cache_key = cache_key
+        return response
+
+    @staticmethod
+    def _post_cache_key(url: str, **kwargs) -> str:
+        return ResponseCache.key("POST", url,
+                                 json.dumps(kwargs.get("json"), sort_keys=True),
+                                 (kwargs.get("headers") or {}).get("Authorization", ""))
+
+    @staticmethod
+    def _timeout_cache_key(cache_key: str) -> str:
+        return ResponseCache.key("POST timeout", cache_key)
+
+    def get_cached_value(self, *key_parts: str) -> Optional[bytes]:
+        """Value stored along with cached responses, e.g. how a crawl was paginated"""
+
+        if self._cache is not None:
+            cached = self._cache.get(ResponseCache.key(*key_parts))
+            if cached is not None:
+                return cached.body
+
+    def cache_value(self, value: bytes, *key_parts: str):
+        if self._cache is not None and not self._offline:
+            self._cache.put(ResponseCache.key(*key_parts), value, {})
+
+    def invalidate(self, response: requests.Response):
+        """Drop a response from the cache, e.g. when it turns out to carry errors"""
+
+        cache_key = getattr(response, "cache_key", None)
+        if self._cache is not None and cache_key is not None:
+            self._cache.delete(cache_key)
+
+    def close(self):
+        self._session.close()
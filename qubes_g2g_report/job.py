@@ -20,43 +20,42 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+import sys
+
+
 from datetime import datetime
 from qubes_g2g_report.enums.job_status import JobStatus
 from qubes_g2g_report.enums.job_type import JobType
-from typing import Optional
+from typing import Optional, Tuple
 
 
 class Job:
+    __slots__ = ('branch', 'creation_time', 'distribution', 'name', 'path', 'release', 'status', 'type')
+
     def __init__(self, gitlab_job_node: dict, branch: str):
-        self._gitlab_job_node = gitlab_job_node
         self.branch = branch
+        self.name: str = sys.intern(gitlab_job_node['name'])
+        self.creation_time: datetime = datetime.fromisoformat(gitlab_job_node['createdAt'])
+        self.path: str = gitlab_job_node['detailedStatus']['detailsPath']
+        self.status: JobStatus = self._parse_status(gitlab_job_node['detailedStatus']['text'])
 
-    @property
-    def creation_time(self) -> datetime:
-        return datetime.fromisoformat(self._gitlab_job_node['createdAt'])
-
-    @property
-    def distribution(self) -> Optional[str]:
-        try:
-            return self.name.split(":")[2]
-        except IndexError:
-            return
-
-    @property
-    def name(self) -> str:
-        return self._gitlab_job_node['name']
+        self.release, self.type, self.distribution = self.parse_name(self.name)
 
-    @property
-    def path(self) -> str:
-        return self._gitlab_job_node['detailedStatus']['detailsPath']
+    @staticmethod
+    def parse_name(name: str) -> Tuple[str, JobType, Optional[str]]:
+        """Release, type and distribution of a job, e.g. r4.2:build:vm-fc41"""
 
-    @property
-    def release(self) -> str:
-        return self.name.split(":")[0].removeprefix('r')
+        # Interned, as all projects share the same job names
+        name_parts = [sys.intern(part) for part in name.split(":")]
+        try:
+            job_type = JobType[name_parts[1].upper()]
+        except (KeyError, IndexError):
+            job_type = JobType.UNKNOWN
+        return sys.intern(name_parts[0].removeprefix('r')), job_type, name_parts[2] if len(name_parts) > 2 else None
 
-    @property
-    def status(self) -> JobStatus:
-        job_status_str = self._gitlab_job_node['detailedStatus']['text'].lower()
+    @staticmethod
+    def _parse_status(job_status_text: str) -> JobStatus:
+        job_status_str = job_status_text.lower()
         if job_status_str in ["failed", "canceled", "skipped"]:
             return JobStatus.FAILURE
 
@@ -64,10 +63,3 @@ class Job:
             return JobStatus.SUCCESS
 
         return JobStatus.UNKNOWN
-
-    @property
-    def type(self) -> JobType:
-        try:
-            return JobType[self.name.split(":")[1].upper()]
-        except (KeyError, IndexError):
-            return JobType.UNKNOWN
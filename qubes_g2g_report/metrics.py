@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+
+class Metrics:
+    """Phase durations, HTTP requests and GraphQL errors of a report generation run"""
+
+    PROMETHEUS_PREFIX = "g2g_report"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new run, e.g. for each resync of a long-running process"""
+
+        with self._lock:
+            self._start_time = time.time()
+            self._start_counter = time.perf_counter()
+            self.duration: Optional[float] = None
+            self.graphql_errors: List[dict] = []
+            self.phases: Dict[str, float] = {}
+            self.requests: List[dict] = []
+            self.success: Optional[bool] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase; durations of a phase entered several times, possibly from several threads, are summed"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def record_request(self, method: str, url: str, status: Optional[int], duration: float, size: int,
+                       retries: int = 0, cached: bool = False):
+        with self._lock:
+            self.requests.append({
+                'method': method,
+                'url': url,
+                'status': status,
+                'duration': duration,
+                'size': size,
+                'retries': retries,
+                'cached': cached,
+            })
+
+    def record_graphql_errors(self, errors: list):
+        with self._lock:
+            self.graphql_errors += errors if isinstance(errors, list) else [errors]
+
+    def finish(self, success: bool):
+        self.duration = time.perf_counter() - self._start_counter
+        self.success = success
+
+    def _requests_by_host(self) -> Dict[str, dict]:
+        hosts = {}
+        for request in self.requests:
+            host = hosts.setdefault(urlsplit(request['url']).netloc, {
+                'requests': 0, 'cached': 0, 'failed': 0, 'retries': 0, 'bytes': 0, 'duration': 0.0, 'statuses': {},
+            })
+            host['requests'] += 1
+            host['cached'] += int(request['cached'])
+            host['failed'] += int(request['status'] is None or request['status'] >= 400)
+            host['retries'] += request['retries']
+            host['bytes'] += request['size']
+            host['duration'] += request['duration']
+            status = str(request['status']) if request['status'] is not None else 'error'
+            host['statuses'][status] = host['statuses'].get(status, 0) + 1
+        return hosts
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'start_time': self._start_time,
+                'duration': self.duration,
+                'success': self.success,
+                'phases': dict(self.phases),
+                'hosts': self._requests_by_host(),
+                'requests': list(self.requests),
+                'graphql_errors': list(self.graphql_errors),
+            }
+
+    def to_prometheus(self) -> str:
+        metrics = self.as_dict()
+        prefix = self.PROMETHEUS_PREFIX
+        lines = []
+
+        def add(name: str, metric_type: str, help_text: str, samples: list):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for labels, value in samples:
+                label_str = ",".join(f'{key}="{label_value}"' for key, label_value in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_str}}} {value}" if label_str else f"{prefix}_{name} {value}")
+
+        add("last_run_timestamp_seconds", "gauge", "Start time of the last report generation",
+            [({}, metrics['start_time'])])
+        add("success", "gauge", "Whether the last report generation succeeded",
+            [({}, int(bool(metrics['success'])))])
+        if metrics['duration'] is not None:
+            add("duration_seconds", "gauge", "Duration of the last report generation",
+                [({}, round(metrics['duration'], 6))])
+        add("phase_duration_seconds", "gauge", "Duration of each report generation phase",
+            [({'phase': phase}, round(duration, 6)) for phase, duration in sorted(metrics['phases'].items())])
+
+        hosts = sorted(metrics['hosts'].items())
+        add("http_requests_total", "counter", "HTTP requests by host and final status",
+            [({'host': host, 'status': status}, count)
+             for host, details in hosts for status, count in sorted(details['statuses'].items())])
+        add("http_cached_responses_total", "counter", "HTTP responses served from the response cache",
+            [({'host': host}, details['cached']) for host, details in hosts])
+        add("http_retries_total", "counter", "HTTP request retries",
+            [({'host': host}, details['retries']) for host, details in hosts])
+        add("http_response_bytes_total", "counter", "HTTP response payload size",
+            [({'host': host}, details['bytes']) for host, details in hosts])
+        add("http_request_duration_seconds_total", "counter", "Time spent in HTTP requests, including retries",
+            [({'host': host}, round(details['duration'], 6)) for host, details in hosts])
+        add("graphql_errors_total", "counter", "GraphQL errors returned by GitLab",
+            [({}, len(metrics['graphql_errors']))])
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write_atomic(path: Path, content: str):
+        # The Prometheus textfile collector may read the file at any time
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+    def write_json(self, path: Path):
+        self._write_atomic(path, json.dumps(self.as_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path: Path):
+        self._write_atomic(path, self.to_prometheus())
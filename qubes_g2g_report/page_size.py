@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import re
+
+
+from typing import Optional, Tuple
+
+
+class AdaptivePageSize:
+    """Page size of a paginated GraphQL crawl, adjusted from the query complexity and response time"""
+
+    # GitLab error message when a query is too complex
+    COMPLEXITY_ERROR_RE = re.compile(r'complexity of (\d+), which exceeds max complexity of (\d+)')
+    GROWTH_FACTOR = 2
+    SHRINK_FACTOR = 2
+
+    def __init__(self, initial: int = 20, minimum: int = 1, maximum: int = 100, target_complexity_ratio: float = 0.8,
+                 target_duration: float = 10.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.size = max(minimum, min(maximum, initial))
+        self.target_complexity_ratio = target_complexity_ratio
+        self.target_duration = target_duration
+
+    @classmethod
+    def parse_complexity_error(cls, message: str) -> Optional[Tuple[int, int]]:
+        match = cls.COMPLEXITY_ERROR_RE.search(message)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+
+    def _clamp(self, size: float) -> int:
+        return max(self.minimum, min(self.maximum, int(size)))
+
+    def on_success(self, duration: float, complexity_score: Optional[int] = None, complexity_limit: Optional[int] = None):
+        # Projects in a page have similar sizes, so cost grows roughly linearly with the page size
+        candidates = [self.size * self.GROWTH_FACTOR]
+        if complexity_score and complexity_limit:
+            candidates.append(self.size * self.target_complexity_ratio * complexity_limit / complexity_score)
+        if duration > 0:
+            candidates.append(self.size * self.target_duration / duration)
+        self.size = self._clamp(min(candidates))
+
+    def on_failure(self, error_message: str = "") -> bool:
+        """Shrink the page after a complexity or timeout error, return False when it cannot shrink anymore"""
+
+        if self.size <= self.minimum:
+            return False
+
+        complexity = self.parse_complexity_error(error_message)
+        if complexity:
+            score, limit = complexity
+            self.size = self._clamp(min(self.size - 1, self.size * self.target_complexity_ratio * limit / score))
+        else:
+            self.size = self._clamp(self.size / self.SHRINK_FACTOR)
+        return True
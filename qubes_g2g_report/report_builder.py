@@ -20,58 +20,225 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+import functools
+import gzip
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
 import requests
 import sys
+import tempfile
+import time
 import yaml
 
 
 from babel.dates import format_timedelta, format_datetime
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timezone
+from qubes_g2g_report.checkpoint import CheckpointJournal
 from qubes_g2g_report.component import Component
+from qubes_g2g_report.gitlab_source import GitlabSource
+from qubes_g2g_report.graphql_decoder import decode_graphql_response
+from qubes_g2g_report.history_store import HistoryStore
+from qubes_g2g_report.http_client import HttpClient
+from qubes_g2g_report.metrics import Metrics
+from qubes_g2g_report.page_size import AdaptivePageSize
+from qubes_g2g_report.report_model import ComponentStatus, ReleaseStatus, StageStatus
+from qubes_g2g_report.response_cache import ResponseCache
+from qubes_g2g_report.state_snapshot import StateSnapshot
+from qubes_g2g_report.templates import get_template
 from jinja2 import Template
-from typing import Optional
+from jinja2.environment import TemplateStream
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from qubes_g2g_report.enums.job_type import JobType
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-class ReportBuilder:
-    MAXIMUM_PAGINATION = 20
-    BUILDER_CONFIG_URL = "https://raw.githubusercontent.com/QubesOS/qubes-builderv2/refs/heads/main/example-configs/qubes-os-r{}.yml"
-
-    def __init__(self, gitlab_url: str, current_release: str, next_release: str, gitlab_token: Optional[str] = None):
-        self._current_release = current_release
-        self._gitlab_token = gitlab_token
-        self._gitlab_url = gitlab_url
-        self._next_release = next_release
-
-        with open('templates/gitlab_query_pipeline.j2', 'r') as f:
-            self._gitlab_query_pipeline_template = Template(f.read())
-
-        with open('templates/gitlab_query.j2', 'r') as f:
-            self._gitlab_query_template = Template(f.read())
-
-        with open('templates/template.md.j2', 'r') as template_fd:
-            self._template_md = Template(template_fd.read())
+try:
+    # libyaml bindings, much faster than the pure Python loader
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
 
-        with open('templates/template.html.j2', 'r') as template_fd:
-            self._template_html = Template(template_fd.read())
 
-    def _build_gitlab_query(self, pagination_offset):
+class ReportBuilder:
+    BUILDER_CONFIG_URL = "https://raw.githubusercontent.com/QubesOS/qubes-builderv2/refs/heads/main/example-configs/qubes-os-r{}.yml"
+    BUILDER_CONFIG_FILE = "qubes-os-r{}.yml"
+    # GraphQL errors for which a smaller page may succeed
+    QUERY_TOO_LARGE_ERROR_RE = re.compile(r'complexity|timed? ?out|timeout', re.IGNORECASE)
+
+    def __init__(self, gitlab_url: str, releases: List[str], gitlab_token: Optional[str] = None,
+                 project_batch_size: int = 10, jobs: int = 4, max_retries: int = 5, cache_dir: Optional[Path] = None,
+                 cache_ttl: float = 300, cache_max_size: int = 256 * 1024 * 1024, offline: bool = False,
+                 state_file: Optional[Path] = None, incremental: bool = False,
+                 builder_config_url: Optional[str] = None, output_dir: Path = Path('public'),
+                 metrics: Optional[Metrics] = None, metrics_file: Optional[Path] = None,
+                 metrics_prometheus_file: Optional[Path] = None, page_size: int = 20,
+                 history_db: Optional[Path] = None, from_history: bool = False, sharded: bool = False,
+                 builder_config_dir: Optional[Path] = None, sources: Optional[List[GitlabSource]] = None,
+                 checkpoint_file: Optional[Path] = None, resume: bool = False):
+        # Parsed builder configurations, by hash of the YAML file
+        self._builder_config_cache: Dict[str, dict] = {}
+        self._builder_config_cache_dir = Path(cache_dir) / 'builder-config' if cache_dir is not None else None
+        self._builder_config_dir = Path(builder_config_dir) if builder_config_dir is not None else None
+        self._builder_config_url = builder_config_url or self.BUILDER_CONFIG_URL
+        self._cache_ttl = cache_ttl
+        self._checkpoint: Optional[CheckpointJournal] = None
+        self._checkpoint_file = checkpoint_file
+        # Without a sources file, the QubesOS group of the --gitlab instance
+        self._sources = list(sources) if sources else [GitlabSource.from_url(gitlab_url, token=gitlab_token)]
+        self._sources_by_name = {source.name: source for source in self._sources}
+        self._sources_ranks = {source.name: rank for rank, source in enumerate(self._sources)}
+        self._from_history = from_history
+        self._history_store = HistoryStore(history_db) if history_db is not None else None
+        self._incremental = incremental
+        self._jobs = max(1, jobs)
+        self._metrics = metrics or Metrics()
+        self._metrics_file = metrics_file
+        self._metrics_prometheus_file = metrics_prometheus_file
+        self._offline = offline
+        cache = ResponseCache(cache_dir, max_size=cache_max_size) if cache_dir is not None else None
+        self._http_client = HttpClient(pool_size=self._jobs, max_retries=max_retries, cache=cache, offline=offline,
+                                       metrics=self._metrics)
+        # Each source gets its own connection pool and rate limit budget
+        for source in self._sources:
+            source.http_client = HttpClient(pool_size=self._jobs, max_retries=max_retries, cache=cache,
+                                            offline=offline, metrics=self._metrics)
+        self._output_dir = Path(output_dir)
+        self._page_size = page_size
+        self._project_batch_size = max(1, project_batch_size)
+        self._releases = list(releases)
+        self._resume = resume
+        self._sharded = sharded
+        self._state_file = state_file
+
+        # Compiled once per process, and cached on disk between runs
+        bytecode_cache_dir = Path(cache_dir) / 'jinja2' if cache_dir is not None else None
+        self._gitlab_query_pipeline_template = get_template('gitlab_query_pipeline.j2', bytecode_cache_dir)
+        self._gitlab_query_pipeline_activity_template = get_template('gitlab_query_pipeline_activity.j2', bytecode_cache_dir)
+        self._gitlab_query_pipeline_jobs_template = get_template('gitlab_query_pipeline_jobs.j2', bytecode_cache_dir)
+        self._gitlab_query_template = get_template('gitlab_query.j2', bytecode_cache_dir)
+        self._gitlab_query_project_pipeline_template = get_template('gitlab_query_project_pipeline.j2', bytecode_cache_dir)
+        self._gitlab_query_projects_template = get_template('gitlab_query_projects.j2', bytecode_cache_dir)
+        self._template_md = get_template('template.md.j2', bytecode_cache_dir)
+        self._template_html = get_template('template.html.j2', bytecode_cache_dir)
+        self._template_index_md = get_template('template_index.md.j2', bytecode_cache_dir)
+        self._template_index_html = get_template('template_index.html.j2', bytecode_cache_dir)
+
+    def _get_release_branches(self) -> List[Tuple[str, str]]:
+        """Pipeline aliases and branches crawled for each project, the release branches and main"""
+
+        branches = [Component.get_release_branch(release) for release in self._releases] + ["main"]
+        return [(Component.branch_node_name(branch), branch) for branch in branches]
+
+    def _build_gitlab_query(self, source: GitlabSource, pagination_offset, pipeline_template: Optional[Template] = None,
+                            page_size: int = 20):
+        pipeline_template = pipeline_template or self._gitlab_query_pipeline_template
         query_pipelines_stubs = [
-            self._gitlab_query_pipeline_template.render(release_name="current",
-                                                        release_branch=f"release{self._current_release}"),
-            self._gitlab_query_pipeline_template.render(release_name="next",
-                                                        release_branch=f"release{self._next_release}"),
-            self._gitlab_query_pipeline_template.render(release_name="main", release_branch="main"),
+            pipeline_template.render(release_name=release_name, release_branch=release_branch)
+            for release_name, release_branch in self._get_release_branches()
         ]
 
         gitlab_query = self._gitlab_query_template.render(
+            group=source.group,
             pipelines="\n".join(query_pipelines_stubs),
             pagination_offset=pagination_offset,
+            page_size=page_size,
         )
 
         return gitlab_query
 
+    def _build_gitlab_projects_query(self, source: GitlabSource,
+                                     projects_pipelines: List[Tuple[str, List[Tuple[str, str]]]]) -> str:
+        query_projects_stubs = []
+        for index, (project_name, pipelines) in enumerate(projects_pipelines):
+            query_pipelines_stubs = [
+                self._gitlab_query_pipeline_template.render(release_name=release_name, release_branch=release_branch)
+                for release_name, release_branch in pipelines
+            ]
+            query_projects_stubs.append(self._gitlab_query_project_pipeline_template.render(
+                project_alias=f"project{index}",
+                project_path=source.project_path(project_name),
+                pipelines="\n".join(query_pipelines_stubs),
+            ))
+
+        return self._gitlab_query_projects_template.render(projects="\n".join(query_projects_stubs))
+
+    def _build_gitlab_pipelines_jobs_query(self, source: GitlabSource, pipelines: List[Tuple[str, dict]]) -> str:
+        query_pipelines_stubs = [
+            self._gitlab_query_pipeline_jobs_template.render(
+                pipeline_alias=f"pipeline{index}",
+                project_path=source.project_path(project_name),
+                pipeline_iid=pipeline_node['iid'],
+                jobs_offset=pipeline_node['jobs']['pageInfo']['endCursor'],
+            )
+            for index, (project_name, pipeline_node) in enumerate(pipelines)
+        ]
+
+        return self._gitlab_query_projects_template.render(projects="\n".join(query_pipelines_stubs))
+
+    def _complete_pipelines_jobs(self, source: GitlabSource, executor: Executor, project_nodes: List[Optional[dict]]):
+        """Fetch the remaining job pages of pipelines whose jobs did not fit in the first page"""
+
+        pending_pipelines = []
+        for project_node in project_nodes:
+            if not project_node:
+                continue
+            for value in project_node.values():
+                if isinstance(value, dict) and value.get('nodes'):
+                    pipeline_node = value['nodes'][0]
+                    if pipeline_node['jobs'].get('pageInfo', {}).get('hasNextPage'):
+                        pending_pipelines.append((project_node['name'], pipeline_node))
+
+        if not pending_pipelines:
+            return
+
+        truncated_pipelines_count = len(pending_pipelines)
+        pages_count = 0
+        requests_count = 0
+        while pending_pipelines:
+            project_nodes, batch_requests_count = self._query_batches(
+                source, executor, self._build_gitlab_pipelines_jobs_query, "pipeline", pending_pipelines,
+                self._reduce_pipeline_jobs_node)
+            requests_count += batch_requests_count
+            next_pending_pipelines = []
+            for (project_name, pipeline_node), project_node in zip(pending_pipelines, project_nodes):
+                if not project_node or not project_node.get('pipeline'):
+                    pipeline_node['jobs']['pageInfo']['hasNextPage'] = False
+                    continue
+                jobs_node = project_node['pipeline']['jobs']
+                pipeline_node['jobs']['nodes'] += jobs_node['nodes']
+                pipeline_node['jobs']['pageInfo'] = jobs_node['pageInfo']
+                pages_count += 1
+                if jobs_node['pageInfo']['hasNextPage']:
+                    next_pending_pipelines.append((project_name, pipeline_node))
+            pending_pipelines = next_pending_pipelines
+
+        print(f"* Fetched {pages_count} additional job page(s) for {truncated_pipelines_count} pipeline(s) "
+              f"in {requests_count} GraphQL request(s)")
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    def close(self):
+        if self._checkpoint is not None:
+            self._checkpoint.close()
+        self._http_client.close()
+        for source in self._sources:
+            source.http_client.close()
+        if self._history_store is not None:
+            self._history_store.close()
+
     def _error_and_exit(self, error_message: str):
         """Print an error message and exit program"""
 
@@ -79,139 +246,706 @@ class ReportBuilder:
         raise RuntimeError
 
     def _get_builder_components_configuration(self, release: str) -> dict:
+        with self._metrics.phase("config_fetch"):
+            return self._fetch_builder_components_configuration(release)
+
+    def _read_builder_components_configuration(self, release: str) -> Optional[bytes]:
+        file_name = self.BUILDER_CONFIG_FILE.format(release)
+        # Either a qubes-builderv2 checkout or its example-configs directory
+        for path in [self._builder_config_dir / 'example-configs' / file_name, self._builder_config_dir / file_name]:
+            if path.is_file():
+                print(f"* Reading QubesOS builder example configuration for release {release} from {path}")
+                return path.read_bytes()
+        print(f"WARNING: No builder configuration file for release {release} in {self._builder_config_dir}, "
+              f"downloading it", file=sys.stderr)
+
+    def _download_builder_components_configuration(self, release: str) -> Optional[bytes]:
         print(f"* Getting QubesOS builder example configuration for release {release}")
-        builder_config_url = self.BUILDER_CONFIG_URL.format(release)
-        response = requests.get(builder_config_url)
-        if response.status_code != 200:
+        builder_config_url = self._builder_config_url.format(release)
+        try:
+            response = self._http_client.get(builder_config_url)
+        except requests.RequestException:
+            response = None
+        if response is None or response.status_code != 200:
             print(f"WARNING: Unable to retrieve builder configuration file for release {release}", file=sys.stderr)
+            return
+        return response.content
+
+    def _fetch_builder_components_configuration(self, release: str) -> dict:
+        content = None
+        if self._builder_config_dir is not None:
+            content = self._read_builder_components_configuration(release)
+        if content is None:
+            content = self._download_builder_components_configuration(release)
+        if content is None:
             return {}
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        components_configuration = self._get_cached_builder_components_configuration(content_hash)
+        if components_configuration is not None:
+            return components_configuration
+
         try:
-            builder_config = yaml.safe_load(response.text)
+            builder_config = yaml.load(content, Loader=YamlSafeLoader)
         except yaml.YAMLError:
             print(f"WARNING: Unable to parse builder configuration file for release {release}", file=sys.stderr)
             return {}
 
-        builder_components_configuration = builder_config.get("components")
-        if not builder_components_configuration:
-            return {}
-
         components_configuration = {}
-        for entry in builder_components_configuration:
+        for entry in (builder_config or {}).get("components") or []:
             if isinstance(entry, dict):
-                components_configuration = {**components_configuration, **entry}
+                components_configuration.update(entry)
+        self._cache_builder_components_configuration(content_hash, components_configuration)
         return components_configuration
 
-    def _get_components(self):
-        projects = []
-        pagination_offset = None
-        for i in range(self.MAXIMUM_PAGINATION):
-            data = self._query_pipelines(pagination_offset)
-            projects += data['data']['group']['projects']['nodes']
+    def _get_cached_builder_components_configuration(self, content_hash: str) -> Optional[dict]:
+        components_configuration = self._builder_config_cache.get(content_hash)
+        if components_configuration is None and self._builder_config_cache_dir is not None:
+            try:
+                with open(self._builder_config_cache_dir / f"{content_hash}.json", 'r') as f:
+                    components_configuration = self._builder_config_cache[content_hash] = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return components_configuration
 
-            if not data['data']['group']['projects']['pageInfo']['hasNextPage']:
+    def _cache_builder_components_configuration(self, content_hash: str, components_configuration: dict):
+        self._builder_config_cache[content_hash] = components_configuration
+        if self._builder_config_cache_dir is None:
+            return
+        try:
+            content = json.dumps(components_configuration)
+        except TypeError:
+            # Values without a JSON representation, e.g. dates, are only cached in memory
+            return
+        self._builder_config_cache_dir.mkdir(parents=True, exist_ok=True)
+        with self._open_atomic(self._builder_config_cache_dir / f"{content_hash}.json") as f:
+            f.write(content.encode())
+
+    def _crawl_group_projects(self, source: GitlabSource, pipeline_template: Optional[Template] = None) -> List[dict]:
+        return [project for page, _ in self._crawl_group_pages(source, pipeline_template) for project in page]
+
+    def _crawl_group_pages(self, source: GitlabSource, pipeline_template: Optional[Template] = None,
+                           pagination_offset: Optional[str] = None) -> Iterator[Tuple[List[dict], dict]]:
+        """Yield the reduced project nodes and the page info of each page of the group, from pagination_offset on"""
+
+        projects_count = 0
+        page_size = AdaptivePageSize(self._page_size)
+        requests_count = 0
+        while True:
+            # Page sizes depend on response times: offline, pages are replayed with the size they were cached with
+            page_plan_key = ("page-size", source.graphql_url, source.token or "",
+                             self._build_gitlab_query(source, pagination_offset, pipeline_template, 0))
+            if self._offline:
+                cached_page_size = source.http_client.get_cached_value(*page_plan_key)
+                if cached_page_size is not None:
+                    page_size.size = int(cached_page_size)
+
+            start = time.perf_counter()
+            data, error, query_too_large, from_cache = self._try_query_gitlab(
+                source, self._build_gitlab_query(source, pagination_offset, pipeline_template, page_size.size),
+                'data.group.projects.nodes.item', self._reduce_project_node)
+            duration = time.perf_counter() - start
+            requests_count += 1
+            if error is not None:
+                previous_page_size = page_size.size
+                if query_too_large and page_size.on_failure(error):
+                    print(f"  -> Page of {previous_page_size} projects too large, retrying with {page_size.size}")
+                    continue
+                self._error_and_exit(error)
+
+            if not from_cache:
+                source.http_client.cache_value(str(page_size.size).encode(), *page_plan_key)
+            query_complexity = data['data'].get('queryComplexity') or {}
+            # The time taken to read a cached response says nothing about the cost of the query
+            page_size.on_success(0 if from_cache else duration, query_complexity.get('score'),
+                                 query_complexity.get('limit'))
+            projects_count += len(data['data']['group']['projects']['nodes'])
+            page_info = data['data']['group']['projects']['pageInfo']
+            yield data['data']['group']['projects']['nodes'], page_info
+            del data
+
+            if not page_info['hasNextPage']:
                 break
 
-            pagination_offset = data['data']['group']['projects']['pageInfo']['endCursor']
+            pagination_offset = page_info['endCursor']
 
-        components = [Component(component) for component in projects]
-        return components
+        print(f"* Crawled {projects_count} project(s) of {source.name} in {requests_count} GraphQL request(s)")
 
-    def _get_distros(self,
-                     components,
-                     builder_components_config_current_release,
-                     builder_components_config_next_release):
-        distros = {'current_release': {}, 'next_release': {}}
+    def _get_components(self, source: GitlabSource, executor: Executor,
+                        snapshot_projects: Optional[Dict[str, dict]]) -> Tuple[List[dict], List[Component]]:
+        """Components of a source, with their project nodes when they are saved in the state snapshot"""
+
+        if snapshot_projects is not None:
+            projects = self._refresh_projects(source, executor, snapshot_projects)
+            return projects, [Component(project, source.name) for project in projects]
+
+        projects = []
+        components = []
+        for page in self._get_group_pages(source, executor):
+            # Project nodes of a page are turned into components, and released, before the next page is fetched
+            components += [Component(project, source.name) for project in page]
+            if self._state_file is not None:
+                projects += page
+        return projects, components
+
+    def _get_group_pages(self, source: GitlabSource, executor: Executor) -> Iterator[List[dict]]:
+        """Yield the project nodes of each page of the group with all their jobs, journaled pages first"""
+
+        pagination_offset = None
+        if self._checkpoint is not None:
+            for page in self._checkpoint.get_pages(source.name):
+                yield [self._reduce_project_node(project) for project in page]
+            has_next_page, pagination_offset = self._checkpoint.get_next_cursor(source.name)
+            if not has_next_page:
+                print(f"* Crawl of {source.name} already completed in checkpoint")
+                return
+
+        for page, page_info in self._crawl_group_pages(source, pagination_offset=pagination_offset):
+            self._complete_pipelines_jobs(source, executor, page)
+            if self._checkpoint is not None:
+                self._checkpoint.record_page(source.name, page, page_info)
+            yield page
+
+    def _query_batch(self, source: GitlabSource, build_query: Callable[[GitlabSource, list], str], alias_prefix: str,
+                     reduce_node: Callable[[Optional[dict]], Optional[dict]],
+                     batch: list) -> Tuple[List[Optional[dict]], int]:
+        data, error, query_too_large, _ = self._try_query_gitlab(source, build_query(source, batch), 'data',
+                                                                 reduce_node)
+        if error is not None:
+            if not query_too_large or len(batch) == 1:
+                self._error_and_exit(error)
+            # Aliased blocks add up to the query complexity: split the batch so each part fits
+            complexity = AdaptivePageSize.parse_complexity_error(error)
+            parts_count = min(len(batch), math.ceil(complexity[0] / complexity[1]) if complexity else 2)
+            part_size = math.ceil(len(batch) / parts_count)
+            print(f"  -> Batch of {len(batch)} too large, splitting it in batches of {part_size}")
+            results, requests_count = [], 1
+            for part_start in range(0, len(batch), part_size):
+                part_results, part_requests_count = self._query_batch(source, build_query, alias_prefix, reduce_node,
+                                                                      batch[part_start:part_start + part_size])
+                results += part_results
+                requests_count += part_requests_count
+            return results, requests_count
+
+        return [data['data'].get(f"{alias_prefix}{index}") for index in range(len(batch))], 1
+
+    def _query_batches(self, source: GitlabSource, executor: Executor, build_query: Callable[[GitlabSource, list], str],
+                       alias_prefix: str, items: list,
+                       reduce_node: Callable[[Optional[dict]], Optional[dict]]) -> Tuple[List[Optional[dict]], int]:
+        """Query items in batches of aliased blocks, return the result of each item and the number of requests"""
+
+        batches = [
+            items[batch_start:batch_start + self._project_batch_size]
+            for batch_start in range(0, len(items), self._project_batch_size)
+        ]
+
+        # executor.map() yields results in submission order, which keeps the report deterministic
+        results, requests_count = [], 0
+        for batch_results, batch_requests_count in executor.map(
+                functools.partial(self._query_batch, source, build_query, alias_prefix, reduce_node), batches):
+            results += batch_results
+            requests_count += batch_requests_count
+        return results, requests_count
+
+    def _query_projects(self, source: GitlabSource, executor: Executor,
+                        projects_pipelines: List[Tuple[str, List[Tuple[str, str]]]]) -> Tuple[List[Optional[dict]], int]:
+        project_nodes, requests_count = self._query_batches(source, executor, self._build_gitlab_projects_query,
+                                                            "project", projects_pipelines, self._reduce_project_node)
+        self._complete_pipelines_jobs(source, executor, project_nodes)
+        return project_nodes, requests_count
+
+    def _query_checkpointed_projects(self, source: GitlabSource, executor: Executor, kind: str,
+                                     projects_pipelines: List[Tuple[str, List[Tuple[str, str]]]]
+                                     ) -> Tuple[List[Optional[dict]], int]:
+        """Same as _query_projects(), skipping projects found in the checkpoint and journaling the others"""
+
+        if self._checkpoint is None:
+            return self._query_projects(source, executor, projects_pipelines)
+
+        project_nodes = self._checkpoint.get_projects(kind, source.name)
+        pending_projects_pipelines = [
+            (project_name, pipelines) for project_name, pipelines in projects_pipelines
+            if project_name not in project_nodes
+        ]
+        if len(pending_projects_pipelines) < len(projects_pipelines):
+            print(f"  -> {len(projects_pipelines) - len(pending_projects_pipelines)} project(s) of {source.name} "
+                  f"already fetched in checkpoint")
+
+        # One batch per worker at a time, so that a failure only loses the round in progress
+        round_size = self._project_batch_size * self._jobs
+        requests_count = 0
+        for round_start in range(0, len(pending_projects_pipelines), round_size):
+            round_projects_pipelines = pending_projects_pipelines[round_start:round_start + round_size]
+            round_project_nodes, round_requests_count = self._query_projects(source, executor, round_projects_pipelines)
+            requests_count += round_requests_count
+            round_project_nodes = {
+                project_name: project_node
+                for (project_name, _), project_node in zip(round_projects_pipelines, round_project_nodes)
+            }
+            self._checkpoint.record_projects(kind, source.name, round_project_nodes)
+            project_nodes.update(round_project_nodes)
+
+        return [project_nodes.get(project_name) for project_name, _ in projects_pipelines], requests_count
+
+    def _refresh_projects(self, source: GitlabSource, executor: Executor, snapshot_projects: Dict[str, dict]) -> List[dict]:
+        print(f"* Checking project pipelines changes of {source.name} since last run...")
+        pipeline_aliases = [release_name for release_name, _ in self._get_release_branches()]
+        activity = self._crawl_group_projects(source, self._gitlab_query_pipeline_activity_template)
+
+        changed_projects = [
+            project['name'] for project in activity
+            if project['name'] not in snapshot_projects
+            or StateSnapshot.fingerprint(project, pipeline_aliases) != StateSnapshot.fingerprint(snapshot_projects[project['name']], pipeline_aliases)
+        ]
+        print(f"* {len(changed_projects)} of {len(activity)} project(s) of {source.name} changed since last run")
+
+        release_branches = self._get_release_branches()
+        refreshed_projects = {}
+        project_nodes, _ = self._query_checkpointed_projects(source, executor, 'refresh',
+                                                             [(name, release_branches) for name in changed_projects])
+        for project_name, project_node in zip(changed_projects, project_nodes):
+            if project_node:
+                refreshed_projects[project_name] = project_node
+
+        projects = []
+        for project in activity:
+            project_node = refreshed_projects.get(project['name']) or snapshot_projects.get(project['name'])
+            if project_node:
+                projects.append(project_node)
+        return projects
+
+    def _get_branch_overrides(self, components: List[Component], *builder_components_configs: dict) -> List[Tuple[Component, List[str]]]:
+        components_branches = []
+        for component in components:
+            branches = []
+            for builder_components_config in builder_components_configs:
+                branch = Component.get_branch_override(builder_components_config.get(component.short_name))
+                if branch and branch not in branches and not component.has_branch_pipelines(branch):
+                    branches.append(branch)
+            if branches:
+                components_branches.append((component, branches))
+        return components_branches
+
+    def _resolve_branch_overrides(self, source: GitlabSource, executor: Executor, components: List[Component],
+                                  *builder_components_configs: dict):
+        components_branches = self._get_branch_overrides(components, *builder_components_configs)
+        if not components_branches:
+            return
+
+        projects_pipelines = []
+        for component, branches in components_branches:
+            print(f"  -> Getting specific branch {', '.join(repr(b) for b in branches)} status for '{component.name}'")
+            projects_pipelines.append((component.name, [(Component.branch_node_name(branch), branch) for branch in branches]))
+
+        project_nodes, requests_count = self._query_checkpointed_projects(source, executor, 'branch_overrides',
+                                                                          projects_pipelines)
+        for (component, _), project_node in zip(components_branches, project_nodes):
+            component.add_branch_pipelines(project_node)
+
+        print(f"* Resolved {len(components_branches)} branch override(s) of {source.name} "
+              f"in {requests_count} GraphQL request(s)")
+
+    def _get_distros(self, components: List[Component], builder_components_configs: Dict[str, dict]) -> dict:
+        distros = {release: {} for release in self._releases}
 
         for component in components:
             print(f"* Getting build jobs for component '{component.name}'")
-            for i in range(2):
-                if i == 0:
-                    release_status = component.get_current_release_jobs(self._current_release,
-                                                                        builder_components_config_current_release.get(component.short_name))
-                    release_distros = distros['current_release']
-                else:
-                    release_status = component.get_next_release_jobs(self._next_release,
-                                                                     builder_components_config_next_release.get(component.short_name))
-                    release_distros = distros['next_release']
-
-                if release_status:
-                    for distro_name, jobs in release_status.items():
-                        release_distros.setdefault(distro_name, {})
-                        release_distros[distro_name][component.short_name] = {
-                            'jobs': jobs,
-                            'component': component,
-                        }
+            self.update_component_distros(distros, component, builder_components_configs)
         return distros
 
-    def _query_pipelines(self, pagination_offset=None):
-        gitlab_query = self._build_gitlab_query(pagination_offset)
+    def update_component_distros(self, distros: dict, component: Component, builder_components_configs: Dict[str, dict]):
+        """Replace the cells of a component in the distros returned by _get_distros()"""
+
+        for release_distros in distros.values():
+            for distro_name in list(release_distros.keys()):
+                release_distros[distro_name].pop(component.key, None)
+                if not release_distros[distro_name]:
+                    del release_distros[distro_name]
+
+        for release in self._releases:
+            release_status = component.get_release_jobs(release, builder_components_configs[release].get(component.short_name))
+            if release_status:
+                release_distros = distros[release]
+                for distro_name, jobs in release_status.items():
+                    release_distros.setdefault(distro_name, {})
+                    release_distros[distro_name][component.key] = {
+                        'jobs': jobs,
+                        'component': component,
+                    }
+
+    def is_release_branch(self, ref: str) -> bool:
+        return any(release_branch == ref for _, release_branch in self._get_release_branches())
+
+    def get_project_source(self, project_path: str, project_url: Optional[str] = None) -> Optional[str]:
+        """Name of the source a project, e.g. of a webhook event, belongs to"""
+
+        for source in self._sources:
+            if source.matches_project(project_path, project_url):
+                return source.name
+
+    @property
+    def _source_names(self) -> List[str]:
+        return [source.name for source in self._sources]
+
+    def _get_source(self, source_name: Optional[str]) -> GitlabSource:
+        # Components without a known source, e.g. recorded before sources were configured, belong to the first one
+        return self._sources_by_name.get(source_name) or self._sources[0]
+
+    def _reduce_project_node(self, project_node: Optional[dict]) -> Optional[dict]:
+        return Component.reduce_project_node(project_node, self._releases)
+
+    def _reduce_pipeline_jobs_node(self, project_node: Optional[dict]) -> Optional[dict]:
+        jobs_node = ((project_node or {}).get('pipeline') or {}).get('jobs')
+        if jobs_node:
+            jobs_node['nodes'] = Component.reduce_job_nodes(jobs_node['nodes'], self._releases)
+        return project_node
+
+    def _try_query_gitlab(self, source: GitlabSource, gitlab_query: str, items_prefix: Optional[str] = None,
+                          reduce_item: Optional[Callable[[Optional[dict]], Optional[dict]]] = None
+                          ) -> Tuple[Optional[dict], Optional[str], bool, bool]:
+        """Run a GraphQL query, return its data or an error, whether a smaller query could succeed and whether
+        the response comes from the cache
+
+        Items of the response at items_prefix, e.g. project nodes, are reduced while the response is decoded.
+        """
 
         headers = {"Content-Type": "application/json", }
 
-        if self._gitlab_token is not None:
-            headers["Authorization"] = f"Bearer {self._gitlab_token}"
+        if source.token is not None:
+            headers["Authorization"] = f"Bearer {source.token}"
 
-        r = requests.post('https://gitlab.com/api/graphql',
-                          headers=headers,
-                          json={"query": gitlab_query})
+        try:
+            r = source.http_client.post(source.graphql_url,
+                                       cache_ttl=self._cache_ttl,
+                                       headers=headers,
+                                       json={"query": gitlab_query})
+        except requests.ReadTimeout as e:
+            # A response too slow to come, unlike a host which could not be reached
+            return None, str(e), True, False
+        except requests.RequestException as e:
+            return None, str(e), False, False
+        from_cache = getattr(r, 'from_cache', False)
         if not r.ok:
-            self._error_and_exit(r.text)
+            # Server errors, e.g. during an outage, are not fixed by smaller queries
+            return None, r.text, False, from_cache
 
-        raw_data = r.json()
+        if reduce_item is not None:
+            raw_data = decode_graphql_response(r.content, items_prefix, reduce_item)
+        else:
+            raw_data = r.json()
 
         if 'errors' in raw_data:
-            self._error_and_exit(raw_data['errors'])
-
+            self._metrics.record_graphql_errors(raw_data['errors'])
+            messages = " ".join(str(error.get('message', error)) if isinstance(error, dict) else str(error)
+                                for error in raw_data['errors'])
+            query_too_large = bool(self.QUERY_TOO_LARGE_ERROR_RE.search(messages))
+            # Complexity errors stay cached, so that an offline replay splits the query the same way
+            if not query_too_large:
+                source.http_client.invalidate(r)
+            return None, str(raw_data['errors']), query_too_large, from_cache
+
+        return raw_data, None, False, from_cache
+
+    def _query_gitlab(self, source: GitlabSource, gitlab_query: str) -> dict:
+        raw_data, error, _, _ = self._try_query_gitlab(source, gitlab_query)
+        if error is not None:
+            self._error_and_exit(error)
         return raw_data
 
     def generate_report(self):
-        builder_components_config_current_release = self._get_builder_components_configuration(self._current_release)
-        builder_components_config_next_release = self._get_builder_components_configuration(self._next_release)
-
-        print("* Getting components...")
-        components = self._get_components()
-        distros = self._get_distros(components, builder_components_config_current_release, builder_components_config_next_release)
+        success = False
+        try:
+            self._generate_report()
+            success = True
+        finally:
+            self.close()
+            self.write_metrics(success)
+
+    def write_metrics(self, success: bool):
+        self._metrics.finish(success)
+        if self._metrics_file is not None:
+            self._metrics.write_json(self._metrics_file)
+        if self._metrics_prometheus_file is not None:
+            self._metrics.write_prometheus(self._metrics_prometheus_file)
+
+    def _generate_report(self):
+        if self._from_history:
+            distros = self._load_history()
+        else:
+            components, builder_components_configs = self.fetch_components()
+
+            distros = self.resolve_distros(components, builder_components_configs)
+            self.record_history(distros)
+        self.write_report(distros)
+        if self._checkpoint is not None:
+            self._checkpoint.discard()
+            self._checkpoint = None
+
+    def record_history(self, distros: dict):
+        if self._history_store is not None:
+            with self._metrics.phase("history"):
+                run_id = self._history_store.record_run(distros, self._releases)
+            print(f"* Recorded run {run_id} in the history store")
+
+    def _load_history(self) -> dict:
+        with self._metrics.phase("history"):
+            run_id = self._history_store.get_last_run(self._releases)
+            if run_id is None:
+                self._error_and_exit(f"No run of releases {', '.join(self._releases)} in the history store")
+            print(f"* Loading run {run_id} from the history store")
+            return self._history_store.load_distros(run_id)
+
+    def fetch_components(self) -> Tuple[List[Component], Dict[str, dict]]:
+        """Fetch components and their jobs, with the builder configuration of each release"""
+
+        snapshot = StateSnapshot.load(self._state_file, self._releases) if self._incremental else None
+        if self._checkpoint_file is not None and self._checkpoint is None:
+            self._checkpoint = CheckpointJournal.open(self._checkpoint_file, self._get_checkpoint_header(), self._resume)
+        # One thread per builder configuration and per source, sources run their queries in a pool of their own
+        with ThreadPoolExecutor(max_workers=len(self._releases) + len(self._sources)) as executor:
+            # Builder configurations are downloaded while the group crawls run
+            builder_config_futures = {
+                release: executor.submit(self._get_builder_components_configuration, release)
+                for release in self._releases
+            }
+
+            print("* Getting components...")
+            source_futures = [
+                executor.submit(self._fetch_source_components, source, snapshot, builder_config_futures)
+                for source in self._sources
+            ]
+            # Components are listed in the order of the sources, which keeps the report deterministic
+            components = []
+            sources_projects = {}
+            for source, future in zip(self._sources, source_futures):
+                projects, source_components = future.result()
+                if self._state_file is not None:
+                    sources_projects[source.name] = {project['name']: project for project in projects}
+                components += source_components
+            builder_components_configs = {release: future.result() for release, future in builder_config_futures.items()}
+
+        if self._state_file is not None:
+            StateSnapshot(self._releases, sources_projects).save(self._state_file)
+        return components, builder_components_configs
+
+    def _get_checkpoint_header(self) -> dict:
+        """What a journaled run has to share with the current one for its checkpoint to be resumed"""
+
+        return {
+            'releases': self._releases,
+            'sources': [[source.name, source.url, source.group] for source in self._sources],
+            'incremental': self._incremental,
+        }
+
+    def _fetch_source_components(self, source: GitlabSource, snapshot: Optional[StateSnapshot],
+                                 builder_config_futures: Dict[str, Future]) -> Tuple[List[dict], List[Component]]:
+        """Crawl the projects of a source, return their nodes and components"""
+
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            with self._metrics.phase("crawl"):
+                projects, components = self._get_components(source, executor,
+                                                            snapshot.sources.get(source.name) if snapshot else None)
+            builder_components_configs = [future.result() for future in builder_config_futures.values()]
+            with self._metrics.phase("branch_overrides"):
+                self._resolve_branch_overrides(source, executor, components, *builder_components_configs)
+        return projects, components
+
+    def resolve_distros(self, components: List[Component], builder_components_configs: Dict[str, dict]) -> dict:
+        with self._metrics.phase("component_resolution"):
+            return self._get_distros(components, builder_components_configs)
+
+    def write_report(self, distros: dict):
+        with self._metrics.phase("flatten"):
+            qubes_status = self._get_qubes_status(distros)
+        self._write_report(qubes_status)
+
+    def _get_qubes_status(self, distros: dict) -> Dict[str, Dict[str, ComponentStatus]]:
         current_time = datetime.now(timezone.utc)
+        # Jobs of a pipeline share their creation time, format each time once
+        formatted_times: Dict[datetime, Tuple[str, str]] = {}
+        release_stages = [(stage, stage.name.lower(), stage.name.capitalize()) for stage in [JobType.BUILD, JobType.INSTALL, JobType.REPRO]]
 
-        # Flatten for HTML display
+        # Flatten for HTML display, sorted once by distribution then component
         qubes_status = {}
-        for release in ['current_release', 'next_release']:
-            for distro, components in distros[release].items():
-                qubes_status.setdefault(distro, {})
-                for component_name, component_details in components.items():
-                    component = component_details['component']
-                    component_release_jobs = component_details['jobs']
-
-                    qubes_status[distro].setdefault(component_name, {})
-                    qubes_status[distro][component_name][release] = {}
-                    qubes_status[distro][component_name]['project_url'] = f"{self._gitlab_url}/QubesOS/{component.name}"
-
-                    qubes_status[distro][component_name][release]["last_job_creation_time"] = ""
-                    qubes_status[distro][component_name][release]["last_job_time_delta"] = ""
-                    for stage in [JobType.BUILD, JobType.INSTALL, JobType.REPRO]:
-                        job = component_release_jobs.get(stage)
+        for distro in sorted(set().union(*(distros[release].keys() for release in self._releases))):
+            releases_components = [(release, self._merge_sources(distros[release].get(distro, {})))
+                                   for release in self._releases]
+            distro_status = qubes_status[distro] = {}
+            for component_name in sorted(set().union(*(components.keys() for _, components in releases_components))):
+                component_status = None
+                for release, components in releases_components:
+                    component_details = components.get(component_name)
+                    if component_details is None:
+                        continue
+                    source = self._get_source(component_details['component'].source)
+                    if component_status is None:
+                        component_status = distro_status[component_name] = ComponentStatus(
+                            source.project_url(component_details['component'].name))
+
+                    release_status = component_status.releases[release] = ReleaseStatus(source=source.name)
+                    last_job = None
+                    for stage, stage_name, stage_title in release_stages:
+                        job = component_details['jobs'].get(stage)
                         if job:
-                            qubes_status[distro][component_name][release]["last_job_creation_time"] = format_datetime(job.creation_time, locale="en")
-                            qubes_status[distro][component_name][release]["last_job_time_delta"] = format_timedelta(job.creation_time - current_time, add_direction=True, locale="en").replace(" ", "&nbsp;")
-                            qubes_status[distro][component_name][release]['branch'] = job.branch
-                            qubes_status[distro][component_name][release][stage.name.lower()] = {
-                                "url": f"{self._gitlab_url}{job.path}",
-                                "badge": "{}_{}.svg".format(stage.name.lower(), job.status.name.lower()),
-                                "text": f"{job.type.name.capitalize()} Status",
-                            }
-
-
-        qubes_status = dict(sorted(qubes_status.items()))
-        for distro in qubes_status.keys():
-            qubes_status[distro] = dict(sorted(qubes_status[distro].items()))
-
-        with open('public/index.md', 'w') as fd:
-            fd.write(self._template_md.render(
-                current_release=self._current_release,
-                next_release=self._next_release,
-                qubes_status=qubes_status))
-
-        with open('public/index.html', 'w') as fd:
-            fd.write(self._template_html.render(current_release=self._current_release,
-                                                next_release=self._next_release,
-                                                qubes_status=qubes_status))
\ No newline at end of file
+                            last_job = job
+                            release_status.stages[stage_name] = StageStatus(
+                                source.job_url(job.path),
+                                f"{stage_name}_{job.status.name.lower()}.svg",
+                                f"{stage_title} Status")
+
+                    if last_job:
+                        release_status.branch = last_job.branch
+                        if last_job.creation_time not in formatted_times:
+                            formatted_times[last_job.creation_time] = (
+                                format_datetime(last_job.creation_time, locale="en"),
+                                format_timedelta(last_job.creation_time - current_time, add_direction=True, locale="en").replace(" ", "&nbsp;"),
+                            )
+                        release_status.last_job_creation_time, release_status.last_job_time_delta = formatted_times[last_job.creation_time]
+        return qubes_status
+
+    def _merge_sources(self, components: dict) -> Dict[str, dict]:
+        """Cells of a distribution and release by component name, a project crawled from several sources
+        showing the jobs of the source which ran them last"""
+
+        merged = {}
+        for component_details in components.values():
+            component = component_details['component']
+            known_details = merged.get(component.short_name)
+            if known_details is None or self._source_order(component_details) < self._source_order(known_details):
+                merged[component.short_name] = component_details
+        return merged
+
+    def _source_order(self, component_details: dict) -> tuple:
+        # Most recent jobs first, then sources in their configured order
+        return (-max(job.creation_time for job in component_details['jobs'].values()).timestamp(),
+                self._sources_ranks.get(component_details['component'].source, 0))
+
+    def _write_report(self, qubes_status: Dict[str, Dict[str, ComponentStatus]]):
+        if self._sharded:
+            self._write_sharded_report(qubes_status)
+            return
+
+        # Pages are rendered while they are written, without holding them in memory
+        with self._metrics.phase("render"):
+            self._output_dir.mkdir(parents=True, exist_ok=True)
+            self._write_file_atomic(self._output_dir / 'index.md', self._stream(self._template_md,
+                                                                                releases=self._releases,
+                                                                                sources=self._source_names,
+                                                                                qubes_status=qubes_status))
+            self._write_file_atomic(self._output_dir / 'index.html', self._stream(self._template_html,
+                                                                                  releases=self._releases,
+                                                                                  sources=self._source_names,
+                                                                                  qubes_status=qubes_status))
+
+    @staticmethod
+    def _stream(template: Template, **context) -> TemplateStream:
+        stream = template.stream(**context)
+        # Template output comes in many small chunks, write them in larger blocks
+        stream.enable_buffering(size=256)
+        return stream
+
+    @staticmethod
+    def _get_distro_page_name(distro: str) -> str:
+        return "distro-" + re.sub('[^A-Za-z0-9._-]+', '_', distro)
+
+    def _write_sharded_report(self, qubes_status: Dict[str, Dict[str, ComponentStatus]]):
+        """Write a page per distribution, an index loading them on demand and the status as JSON and NDJSON"""
+
+        # Chunks of each artifact, only generated when the artifact is written
+        artifacts = {}
+        distros = []
+        for distro, components in qubes_status.items():
+            page_name = self._get_distro_page_name(distro)
+            artifacts[f"{page_name}.md"] = self._stream(self._template_md,
+                                                        releases=self._releases,
+                                                        sources=self._source_names,
+                                                        qubes_status={distro: components})
+            artifacts[f"{page_name}.html"] = self._stream(self._template_html,
+                                                          releases=self._releases,
+                                                          sources=self._source_names,
+                                                          qubes_status={distro: components})
+            distros.append({
+                'name': distro,
+                'components': len(components),
+                'html_page': f"{page_name}.html",
+                'md_page': f"{page_name}.md",
+            })
+
+        artifacts['index.md'] = self._stream(self._template_index_md,
+                                             releases=self._releases,
+                                             distros=distros)
+        artifacts['index.html'] = self._stream(self._template_index_html,
+                                               releases=self._releases,
+                                               distros=distros)
+        json_encoder = json.JSONEncoder(separators=(',', ':'))
+        artifacts['status.json'] = itertools.chain(json_encoder.iterencode({
+            'releases': self._releases,
+            'sources': self._source_names,
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'distros': {
+                distro: {component_name: component_status.as_dict() for component_name, component_status in components.items()}
+                for distro, components in qubes_status.items()
+            },
+        }), ["\n"])
+        artifacts['status.ndjson'] = (
+            json_encoder.encode({'distro': distro, 'component': component_name, **component_status.as_dict()}) + "\n"
+            for distro, components in qubes_status.items()
+            for component_name, component_status in components.items()
+        )
+
+        with self._metrics.phase("render"):
+            self._output_dir.mkdir(parents=True, exist_ok=True)
+            for name, chunks in artifacts.items():
+                self._write_artifact(self._output_dir / name, chunks)
+
+            # Pages of distributions which are not built anymore
+            for path in self._output_dir.glob("distro-*"):
+                if path.name.removesuffix('.gz').removesuffix('.br') not in artifacts:
+                    path.unlink()
+
+    @staticmethod
+    @contextmanager
+    def _open_atomic(path: Path) -> Iterator[BinaryIO]:
+        """Open a report file for writing so that readers, e.g. a web server, never see a partial file"""
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield f
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def _write_file_atomic(cls, path: Path, chunks: Iterable[str]):
+        with cls._open_atomic(path) as f:
+            for chunk in chunks:
+                f.write(chunk.encode())
+
+    def _write_artifact(self, path: Path, chunks: Iterable[str]):
+        """Write a file along with its precompressed .gz and, when brotli is installed, .br versions"""
+
+        brotli_path = path.with_name(path.name + '.br')
+        with ExitStack() as stack:
+            f = stack.enter_context(self._open_atomic(path))
+            gzip_raw_file = stack.enter_context(self._open_atomic(path.with_name(path.name + '.gz')))
+            # No file name nor timestamp in the gzip header, so that unchanged files are identical between runs
+            gzip_file = stack.enter_context(gzip.GzipFile(filename='', mode='wb', compresslevel=9, mtime=0,
+                                                          fileobj=gzip_raw_file))
+            if brotli is not None:
+                brotli_file = stack.enter_context(self._open_atomic(brotli_path))
+                brotli_compressor = brotli.Compressor()
+            for chunk in chunks:
+                data = chunk.encode()
+                f.write(data)
+                gzip_file.write(data)
+                if brotli is not None:
+                    brotli_file.write(brotli_compressor.process(data))
+            if brotli is not None:
+                brotli_file.write(brotli_compressor.finish())
+
+        if brotli is None:
+            # Would be served instead of the up to date file
+            brotli_path.unlink(missing_ok=True)
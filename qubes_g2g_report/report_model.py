@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+from typing import Dict, Optional
+
+
+class StageStatus:
+    """Badge of a build, install or repro job in a report cell"""
+
+    __slots__ = ('badge', 'text', 'url')
+
+    def __init__(self, url: str, badge: str, text: str):
+        self.url = url
+        self.badge = badge
+        self.text = text
+
+    def as_dict(self) -> dict:
+        return {'url': self.url, 'badge': self.badge, 'text': self.text}
+
+
+class ReleaseStatus:
+    """Report cell of a component for a distribution and a release"""
+
+    __slots__ = ('branch', 'last_job_creation_time', 'last_job_time_delta', 'source', 'stages')
+
+    def __init__(self, branch: str = "", last_job_creation_time: str = "", last_job_time_delta: str = "",
+                 stages: Optional[Dict[str, StageStatus]] = None, source: str = ""):
+        self.branch = branch
+        self.last_job_creation_time = last_job_creation_time
+        self.last_job_time_delta = last_job_time_delta
+        # Name of the GitLab source the jobs come from
+        self.source = source
+        # By stage name, e.g. 'build'
+        self.stages = stages or {}
+
+    def as_dict(self) -> dict:
+        return {
+            'last_job_creation_time': self.last_job_creation_time,
+            'last_job_time_delta': self.last_job_time_delta,
+            'branch': self.branch,
+            'source': self.source,
+            **{stage: stage_status.as_dict() for stage, stage_status in self.stages.items()},
+        }
+
+
+class ComponentStatus:
+    """Row of a component in the table of a distribution"""
+
+    __slots__ = ('project_url', 'releases')
+
+    def __init__(self, project_url: str, releases: Optional[Dict[str, ReleaseStatus]] = None):
+        self.project_url = project_url
+        # By release number, e.g. '4.2'
+        self.releases = releases or {}
+
+    def as_dict(self) -> dict:
+        return {
+            **{release: release_status.as_dict() for release, release_status in self.releases.items()},
+            'project_url': self.project_url,
+        }
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+from pathlib import Path
+from typing import List, Mapping, Optional, Tuple
+
+
+class CachedResponse:
+    def __init__(self, body: bytes, headers: dict, stored_at: float):
+        self.body = body
+        self.headers = headers
+        self.stored_at = stored_at
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("Last-Modified")
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.stored_at < ttl
+
+
+class ResponseCache:
+    """On-disk HTTP response cache, evicting least recently used entries above max_size"""
+
+    STORED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+    def __init__(self, directory: Path, max_size: int = 256 * 1024 * 1024):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        # Size of the cached bodies, kept up to date by put() and delete() rather than scanning the directory
+        self._total_size = sum(size for _, size, _ in self._scan())
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _paths(self, key: str):
+        return self._directory / f"{key}.json", self._directory / f"{key}.body"
+
+    @staticmethod
+    def _write_atomic(path: Path, content: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            try:
+                meta = json.loads(meta_path.read_text())
+                body = body_path.read_bytes()
+                os.utime(body_path)
+            except (OSError, ValueError):
+                return
+        return CachedResponse(body, meta["headers"], meta["stored_at"])
+
+    @staticmethod
+    def _size(path: Path) -> int:
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+
+    def put(self, key: str, body: bytes, headers: Mapping[str, str]):
+        meta_path, body_path = self._paths(key)
+        meta = {
+            "headers": {name: headers[name] for name in self.STORED_HEADERS if headers.get(name)},
+            "stored_at": time.time(),
+        }
+        with self._lock:
+            self._total_size -= self._size(body_path)
+            self._write_atomic(body_path, body)
+            self._write_atomic(meta_path, json.dumps(meta).encode())
+            self._total_size += len(body)
+            if self._total_size > self._max_size:
+                self._evict()
+
+    def delete(self, key: str):
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            self._total_size -= self._size(body_path)
+            meta_path.unlink(missing_ok=True)
+            body_path.unlink(missing_ok=True)
+
+    def touch(self, key: str):
+        """Mark an entry as revalidated, without writing its body again"""
+
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            try:
+                meta = json.loads(meta_path.read_text())
+                meta["stored_at"] = time.time()
+                self._write_atomic(meta_path, json.dumps(meta).encode())
+                os.utime(body_path)
+            except (OSError, ValueError):
+                pass
+
+    def _scan(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for body_path in self._directory.glob("*.body"):
+            try:
+                stat = body_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, body_path))
+        return entries
+
+    def _evict(self):
+        # The directory is only scanned once over max_size, its total also catching up with other processes
+        entries = self._scan()
+        self._total_size = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, body_path in entries:
+            if self._total_size <= self._max_size:
+                break
+            body_path.with_suffix(".json").unlink(missing_ok=True)
+            body_path.unlink(missing_ok=True)
+            self._total_size -= size
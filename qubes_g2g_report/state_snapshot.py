@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import os
+import sys
+import tempfile
+
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class StateSnapshot:
+    """Project nodes of the previous run, used to only re-query projects whose pipelines changed"""
+
+    # Version 2 names pipeline aliases after their branch, version 3 keeps the projects of each source,
+    # version 4 escapes punctuation of branch names in aliases
+    VERSION = 4
+
+    def __init__(self, releases: List[str], sources: Optional[Dict[str, Dict[str, dict]]] = None):
+        self.releases = releases
+        # Project nodes by name, by source name
+        self.sources = sources or {}
+
+    @staticmethod
+    def fingerprint(project_node: dict, pipeline_aliases: List[str]) -> list:
+        fingerprint = []
+        for alias in pipeline_aliases:
+            pipelines = (project_node.get(alias) or {}).get('nodes')
+            if pipelines:
+                fingerprint.append([pipelines[0]['id'], pipelines[0].get('updatedAt')])
+            else:
+                fingerprint.append(None)
+        return fingerprint
+
+    @classmethod
+    def load(cls, path: Path, releases: List[str]) -> Optional["StateSnapshot"]:
+        try:
+            with open(path, 'r') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Unable to read state snapshot {path}: {e}", file=sys.stderr)
+            return
+
+        if raw.get('version') != cls.VERSION or raw.get('releases') != releases:
+            print("* State snapshot does not match the requested releases, ignoring it")
+            return
+        return cls(releases, raw['sources'])
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': self.VERSION, 'releases': self.releases, 'sources': self.sources}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import functools
+
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+from pathlib import Path
+from typing import Optional
+
+
+# Templates are shipped next to the package, so that the tool can run from any directory
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / 'templates'
+
+
+@functools.lru_cache(maxsize=None)
+def get_environment(bytecode_cache_dir: Optional[Path] = None) -> Environment:
+    """Jinja2 environment shared by the whole process, each template is compiled once"""
+
+    if bytecode_cache_dir is not None:
+        bytecode_cache_dir.mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(str(bytecode_cache_dir))
+    else:
+        # Per-user directory in the system temporary directory
+        bytecode_cache = FileSystemBytecodeCache()
+    return Environment(loader=FileSystemLoader(TEMPLATES_DIR), bytecode_cache=bytecode_cache,
+                       # Templates are only reloaded when the process restarts
+                       auto_reload=False)
+
+
+def get_template(name: str, bytecode_cache_dir: Optional[Path] = None) -> Template:
+    return get_environment(bytecode_cache_dir).get_template(name)
@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+# -*- encoding: utf8 -*-
+#
+# The Qubes OS Project, http://www.qubes-os.org
+#
+# Copyright (C) 2024 Guillaume Chinal <guiiix@invisiblethingslab.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import hmac
+import json
+import sys
+import threading
+import time
+import traceback
+
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from qubes_g2g_report.component import Component
+from qubes_g2g_report.job import Job
+from qubes_g2g_report.report_builder import ReportBuilder
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+
+class ReportWatcher:
+    """Keep the report model in memory and update it from GitLab pipeline and job webhook events"""
+
+    PIPELINE_EVENT = "Pipeline Hook"
+    JOB_EVENT = "Job Hook"
+
+    def __init__(self, report_builder: ReportBuilder, webhook_secret: Optional[str] = None, debounce: float = 5.0,
+                 max_render_delay: float = 60.0, resync_interval: float = 3600.0):
+        self._report_builder = report_builder
+        self._webhook_secret = webhook_secret
+        self._debounce = debounce
+        self._max_render_delay = max_render_delay
+        self._resync_interval = resync_interval
+
+        # Protects the model below, webhook events are handled concurrently
+        self._lock = threading.RLock()
+        # By source and project name
+        self._components: Dict[Tuple[str, str], Component] = {}
+        self._builder_components_configs: Dict[str, dict] = {}
+        self._distros: Optional[dict] = None
+        # Events received during a full resync, applied again to its result
+        self._resync_events: Optional[List[Tuple[str, tuple]]] = None
+        self._render_timer: Optional[threading.Timer] = None
+        # Monotonic time the report is rendered at the latest, set by the first event since the last render
+        self._render_deadline: Optional[float] = None
+        self._stop_event = threading.Event()
+        self.events_count = 0
+        self.renders_count = 0
+
+    def full_resync(self):
+        """Fetch every component again and render the report"""
+
+        self._report_builder.metrics.reset()
+        with self._lock:
+            self._resync_events = []
+        success = False
+        try:
+            components, builder_components_configs = self._report_builder.fetch_components()
+            distros = self._report_builder.resolve_distros(components, builder_components_configs)
+            self._report_builder.record_history(distros)
+            with self._lock:
+                self._components = {(component.source, component.name): component for component in components}
+                self._builder_components_configs = builder_components_configs
+                self._distros = distros
+                resync_events, self._resync_events = self._resync_events, None
+                for event, update in resync_events:
+                    self._apply_event(event, *update)
+            self.render()
+            success = True
+        finally:
+            with self._lock:
+                self._resync_events = None
+            self._report_builder.write_metrics(success)
+
+    def render(self):
+        with self._lock:
+            if self._render_timer is not None:
+                self._render_timer.cancel()
+                self._render_timer = None
+            self._render_deadline = None
+            if self._distros is None:
+                return
+            self._report_builder.write_report(self._distros)
+            self.renders_count += 1
+        print(f"* Report rendered ({self.events_count} event(s) received)")
+
+    def schedule_render(self):
+        """Render once no event was received for the debounce delay, or max_render_delay after the first event"""
+
+        with self._lock:
+            if self._render_timer is not None:
+                self._render_timer.cancel()
+            now = time.monotonic()
+            if self._render_deadline is None:
+                self._render_deadline = now + self._max_render_delay
+            delay = max(0.0, min(self._debounce, self._render_deadline - now))
+            self._render_timer = threading.Timer(delay, self.render)
+            self._render_timer.daemon = True
+            self._render_timer.start()
+
+    @staticmethod
+    def _parse_event_time(value: Optional[str]) -> str:
+        # Webhooks use either '2024-01-01 10:00:00 UTC' or ISO 8601 dates
+        if not value:
+            return datetime.now().astimezone().isoformat()
+        if value.endswith(' UTC'):
+            return value.removesuffix(' UTC').replace(' ', 'T') + '+00:00'
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).isoformat()
+
+    @classmethod
+    def _build_job_node(cls, project_path: str, job_id: int, name: str, status: str, created_at: Optional[str]) -> dict:
+        """Build a job node as returned by the GraphQL API"""
+
+        return {
+            'name': name,
+            'createdAt': cls._parse_event_time(created_at),
+            'detailedStatus': {'detailsPath': f"/{project_path}/-/jobs/{job_id}", 'text': status},
+        }
+
+    def _parse_pipeline_event(self, payload: dict) -> Tuple[Optional[str], str, str, int, List[Job]]:
+        pipeline = payload['object_attributes']
+        project = payload['project']
+        source = self._report_builder.get_project_source(project['path_with_namespace'], project.get('web_url'))
+        jobs = {}
+        for build in payload.get('builds') or []:
+            job = Job(self._build_job_node(project['path_with_namespace'], build['id'], build['name'],
+                                           build['status'], build.get('created_at')), pipeline['ref'])
+            # Retried jobs are listed along with their new attempt
+            if job.name not in jobs or jobs[job.name].creation_time <= job.creation_time:
+                jobs[job.name] = job
+        return source, project['name'], pipeline['ref'], int(pipeline['id']), list(jobs.values())
+
+    def _parse_job_event(self, payload: dict) -> Tuple[Optional[str], str, str, int, Job]:
+        repository = payload['repository']
+        project_path = urlsplit(repository['homepage']).path.strip('/')
+        source = self._report_builder.get_project_source(project_path, repository['homepage'])
+        job = Job(self._build_job_node(project_path, payload['build_id'], payload['build_name'],
+                                       payload['build_status'], payload.get('build_created_at')), payload['ref'])
+        return source, repository['name'], payload['ref'], int(payload['pipeline_id']), job
+
+    def _get_pipeline_alias(self, component: Component, ref: str) -> Optional[str]:
+        # Release branches, main and branches set in the builder configuration are crawled, under the branch name
+        if self._report_builder.is_release_branch(ref) or component.has_branch_pipelines(ref):
+            return Component.branch_node_name(ref)
+
+    def handle_event(self, event: str, payload: dict) -> bool:
+        """Apply a webhook event to the model, return whether the report needs to be rendered again"""
+
+        if event == self.PIPELINE_EVENT:
+            update = self._parse_pipeline_event(payload)
+        elif event == self.JOB_EVENT:
+            update = self._parse_job_event(payload)
+        else:
+            return False
+
+        with self._lock:
+            self.events_count += 1
+            if self._resync_events is not None:
+                # The running resync may have fetched the pipeline before this event
+                self._resync_events.append((event, update))
+            updated = self._distros is not None and self._apply_event(event, *update)
+        if updated:
+            self.schedule_render()
+        return updated
+
+    def _apply_event(self, event: str, source: Optional[str], project_name: str, ref: str, pipeline_id: int,
+                     jobs: Union[List[Job], Job]) -> bool:
+        # Projects outside of the crawled groups
+        if source is None:
+            return False
+
+        with self._lock:
+            component = self._components.get((source, project_name))
+            if component is None:
+                component = Component({'name': project_name}, source)
+            pipeline_alias = self._get_pipeline_alias(component, ref)
+            if pipeline_alias is None:
+                return False
+
+            if event == self.PIPELINE_EVENT:
+                changed = component.update_pipeline(pipeline_alias, pipeline_id, jobs)
+            else:
+                changed = component.update_job(pipeline_alias, pipeline_id, jobs)
+            if not changed:
+                return False
+
+            self._components[source, project_name] = component
+            self._report_builder.update_component_distros(self._distros, component, self._builder_components_configs)
+        return True
+
+    def _resync_loop(self):
+        while not self._stop_event.wait(self._resync_interval):
+            print("* Periodic full resync")
+            try:
+                self.full_resync()
+            except Exception:
+                # Keep serving the previous model, the next resync may succeed
+                traceback.print_exc()
+
+    def make_server(self, host: str, port: int) -> ThreadingHTTPServer:
+        watcher = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def _reply(self, code: int, body: dict):
+                content = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                if self.path != '/healthz':
+                    self._reply(404, {'error': 'not found'})
+                    return
+                self._reply(200, {
+                    'ready': watcher._distros is not None,
+                    'events': watcher.events_count,
+                    'renders': watcher.renders_count,
+                })
+
+            def do_POST(self):
+                if watcher._webhook_secret is not None and not hmac.compare_digest(
+                        self.headers.get('X-Gitlab-Token', ''), watcher._webhook_secret):
+                    self._reply(401, {'error': 'invalid token'})
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    updated = watcher.handle_event(self.headers.get('X-Gitlab-Event', ''), payload)
+                except (KeyError, TypeError, ValueError) as e:
+                    self._reply(400, {'error': f"invalid event: {e!r}"})
+                    return
+                self._reply(200, {'updated': updated})
+
+            def log_message(self, format, *args):
+                pass
+
+        return ThreadingHTTPServer((host, port), WebhookHandler)
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8080):
+        server = self.make_server(host, port)
+        print(f"* Listening for GitLab webhooks on {host}:{server.server_address[1]}")
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        try:
+            self.full_resync()
+            resync_thread = threading.Thread(target=self._resync_loop, daemon=True)
+            resync_thread.start()
+            self._stop_event.wait()
+        except KeyboardInterrupt:
+            print("* Stopping", file=sys.stderr)
+        finally:
+            self._stop_event.set()
+            server.shutdown()
+            server.server_close()
+            self._report_builder.close()
+
+    def stop(self):
+        self._stop_event.set()